@@ -1,4 +1,5 @@
 from django import template
+from django.utils.html import format_html, format_html_join
 
 register = template.Library()
 
@@ -6,3 +7,65 @@ register = template.Library()
 @register.filter
 def addclass(field, css):
     return field.as_widget(attrs={'class': css})
+
+
+@register.filter
+def get_item(mapping, key):
+    return mapping.get(key) if mapping else None
+
+
+@register.simple_tag(takes_context=True)
+def url_replace(context, **kwargs):
+    # query_params - канонические параметры страницы, если view их дала
+    query = context.get('query_params', context['request'].GET).copy()
+    for key, value in kwargs.items():
+        if value in (None, ''):
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return query.urlencode()
+
+
+def _srcset(variants, image_format):
+    """'url 480w, url 960w' по всем размерам, без повторов ширины."""
+    widths = {}
+    for formats in variants.values():
+        variant = formats.get(image_format)
+        if variant:
+            widths.setdefault(variant['width'], variant['url'])
+    return ', '.join(f'{url} {width}w'
+                     for width, url in sorted(widths.items()))
+
+
+@register.simple_tag
+def responsive_image(variants, src='', width=None, height=None, alt='',
+                     sizes='(max-width: 576px) 100vw, 480px',
+                     max_width=480):
+    """<picture> со srcset по всем вариантам картинки, ленивой загрузкой
+    и заранее известными width/height, чтобы страница не прыгала.
+
+    variants - {имя размера: {формат: {url, width, height}}}, как их
+    отдает posts.images.resolve_thumbnails; самый узкий jpeg идет в src.
+    Без вариантов выводится src с width/height, ужатыми до max_width."""
+    attrs = {'loading': 'lazy', 'decoding': 'async', 'alt': alt}
+    sources = ''
+    if variants:
+        smallest = min((formats['jpeg'] for formats in variants.values()),
+                       key=lambda variant: variant['width'])
+        src, width, height = (smallest['url'], smallest['width'],
+                              smallest['height'])
+        attrs.update(srcset=_srcset(variants, 'jpeg'), sizes=sizes)
+        other_formats = [image_format for image_format
+                         in next(iter(variants.values()))
+                         if image_format != 'jpeg']
+        sources = format_html_join(
+            '', '<source type="image/{}" srcset="{}" sizes="{}">',
+            ((image_format, _srcset(variants, image_format), sizes)
+             for image_format in other_formats))
+    elif width and height and width > max_width:
+        width, height = max_width, max(1, round(height * max_width / width))
+    if width and height:
+        attrs.update(width=width, height=height)
+    return format_html(
+        '<picture>{}<img src="{}" {}></picture>', sources, src,
+        format_html_join(' ', '{}="{}"', attrs.items()))
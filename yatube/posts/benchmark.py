@@ -0,0 +1,231 @@
+import json
+import os
+import random
+import time
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client
+from django.urls import URLPattern, get_resolver, reverse
+from faker import Faker
+from mixer.backend.django import mixer
+
+from .counters import reconcile_counters
+from .models import Comment, Follow, Group, Like, Post
+from .search import get_search_backend
+from .stats import rebuild_stats
+from .timeline import rebuild_timelines
+from .trending import recompute_scores
+
+User = get_user_model()
+
+BENCHMARK_NAMESPACES = ('posts', 'users', 'about')
+
+BASELINE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'benchmarks',
+    'query_baseline.json')
+
+DATASET_SIZES = {
+    'users': 1000,
+    'groups': 20,
+    'posts': 5000,
+    'follows': 5000,
+    'likes': 20000,
+    'comments': 10000,
+}
+
+
+class Dataset:
+    """Объекты, которые подставляются в параметры маршрутов."""
+
+    def __init__(self, user, author, group, post):
+        self.user = user
+        self.author = author
+        self.group = group
+        self.post = post
+
+    def url_kwargs(self, pattern: URLPattern) -> dict:
+        values = {
+            'slug': self.group.slug,
+            'username': self.author.username,
+            'post_id': self.post.pk,
+        }
+        return {name: values[name] for name in pattern.pattern.converters}
+
+    def url_query(self, name: str) -> str:
+        if name == 'posts:search_result':
+            return '?' + urlencode({'q': self.post.text.split()[0]})
+        return ''
+
+
+def _random_pairs(left, right, count):
+    pairs = set()
+    attempts = count * 3
+    while len(pairs) < count and attempts:
+        first, second = random.choice(left), random.choice(right)
+        if first != second:
+            pairs.add((first, second))
+        attempts -= 1
+    return pairs
+
+
+def seed_dataset(sizes=None, seed=0, batch_size=None) -> Dataset:
+    """Заполняет базу правдоподобными данными через bulk_create.
+
+    Сигналы при этом не срабатывают, поэтому ленты, поисковый индекс
+    и счетчики пересобираются в конце."""
+    sizes = dict(DATASET_SIZES, **(sizes or {}))
+    random.seed(seed)
+    fake = Faker('ru_RU')
+    fake.seed_instance(seed)
+
+    User.objects.bulk_create(
+        (User(username=f'{fake.user_name()}{number}',
+              first_name=fake.first_name(), last_name=fake.last_name())
+         for number in range(sizes['users'])),
+        batch_size=batch_size)
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    groups = [mixer.blend(Group, slug=f'group-{number}',
+                          title=f'{fake.word()} {number}')
+              for number in range(sizes['groups'])]
+    group_ids = [group.pk for group in groups] + [None]
+
+    Post.objects.bulk_create(
+        (Post(author_id=random.choice(user_ids),
+              group_id=random.choice(group_ids),
+              text=fake.paragraph(nb_sentences=5))
+         for _ in range(sizes['posts'])),
+        batch_size=batch_size)
+    post_ids = list(Post.objects.values_list('pk', flat=True))
+
+    Follow.objects.bulk_create(
+        (Follow(user_id=user_id, author_id=author_id) for user_id, author_id
+         in _random_pairs(user_ids, user_ids, sizes['follows'])),
+        batch_size=batch_size, ignore_conflicts=True)
+    Like.objects.bulk_create(
+        (Like(user_id=user_id, post_id=post_id) for user_id, post_id
+         in _random_pairs(user_ids, post_ids, sizes['likes'])),
+        batch_size=batch_size, ignore_conflicts=True)
+    Comment.objects.bulk_create(
+        (Comment(author_id=random.choice(user_ids),
+                 post_id=random.choice(post_ids),
+                 text=fake.sentence())
+         for _ in range(sizes['comments'])),
+        batch_size=batch_size)
+
+    rebuild_timelines()
+    get_search_backend().rebuild()
+    reconcile_counters()
+    recompute_scores()
+    rebuild_stats()
+
+    post = Post.objects.order_by('-comments_count').first()
+    author = post.author
+    user = User.objects.exclude(pk=author.pk).first()
+    Follow.objects.get_or_create(user=user, author=author)
+    return Dataset(user=user, author=author,
+                   group=groups[0], post=post)
+
+
+def load_dataset():
+    """Dataset из уже заполненной базы или None, если она пуста."""
+    post = Post.objects.order_by('-comments_count').first()
+    group = Group.objects.first()
+    if post is None or group is None:
+        return None
+    user = User.objects.exclude(pk=post.author_id).first() or post.author
+    return Dataset(user=user, author=post.author, group=group, post=post)
+
+
+def url_cases(dataset: Dataset):
+    """(имя маршрута, url) для всех маршрутов BENCHMARK_NAMESPACES."""
+    resolver = get_resolver()
+    for namespace in BENCHMARK_NAMESPACES:
+        _, sub_resolver = resolver.namespace_dict[namespace]
+        for pattern in sub_resolver.url_patterns:
+            name = f'{namespace}:{pattern.name}'
+            url = reverse(name, kwargs=dataset.url_kwargs(pattern))
+            yield name, url + dataset.url_query(name)
+
+
+class SQLTimer:
+    """execute_wrapper, считающий запросы и время в базе."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+def measure(client: Client, url: str) -> dict:
+    timer = SQLTimer()
+    start = time.perf_counter()
+    with connection.execute_wrapper(timer):
+        client.get(url)
+    total = time.perf_counter() - start
+    return {
+        'queries': timer.queries,
+        'sql_time': round(timer.seconds * 1000, 2),
+        'render_time': round((total - timer.seconds) * 1000, 2),
+    }
+
+
+def run_benchmark(dataset: Dataset, clear_cache=None) -> dict:
+    """{'anonymous'|'authenticated': {route: метрики}}."""
+    results = {'anonymous': {}, 'authenticated': {}}
+    for name, url in url_cases(dataset):
+        for viewer, results_by_route in results.items():
+            if clear_cache is not None:
+                clear_cache()
+            # не из INTERNAL_IPS, чтобы не мерить debug toolbar
+            client = Client(REMOTE_ADDR='10.0.0.1')
+            if viewer == 'authenticated':
+                client.force_login(dataset.user)
+            results_by_route[name] = measure(client, url)
+    return results
+
+
+def compare(results: dict, baseline: dict, query_tolerance=0,
+            time_tolerance=None) -> list:
+    """Регрессии относительно baseline: число запросов больше
+    на query_tolerance, время - больше чем в (1 + time_tolerance) раз."""
+    regressions = []
+    for viewer, routes in results.items():
+        for name, metrics in routes.items():
+            expected = baseline.get(viewer, {}).get(name)
+            if expected is None:
+                regressions.append(f'{viewer} {name}: нет в baseline')
+                continue
+            if metrics['queries'] > expected['queries'] + query_tolerance:
+                regressions.append(
+                    f'{viewer} {name}: запросов {metrics["queries"]}, '
+                    f'в baseline {expected["queries"]}')
+            if time_tolerance is None:
+                continue
+            for metric in ('sql_time', 'render_time'):
+                limit = expected[metric] * (1 + time_tolerance)
+                if metrics[metric] > limit:
+                    regressions.append(
+                        f'{viewer} {name}: {metric} {metrics[metric]} мс, '
+                        f'в baseline {expected[metric]} мс')
+    return regressions
+
+
+def load_baseline(path) -> dict:
+    with open(path, encoding='utf-8') as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(path, results) -> None:
+    with open(path, 'w', encoding='utf-8') as baseline_file:
+        json.dump(results, baseline_file, ensure_ascii=False, indent=2,
+                  sort_keys=True)
+        baseline_file.write('\n')
@@ -0,0 +1,146 @@
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from . import like_buffer
+from .models import Comment, Like, Post
+from .signals import invalidate_post_pages
+from .sqlite import retry_on_busy
+from .trending import score_change
+
+
+def _increment(post_id: int, likes: int = 0, comments: int = 0) -> None:
+    Post.objects.filter(pk=post_id).update(
+        likes_count=F('likes_count') + likes,
+        comments_count=F('comments_count') + comments,
+        score=score_change(likes, comments),
+    )
+
+
+def bump_likes(post_id: int, delta: int) -> None:
+    if like_buffer.is_enabled():
+        like_buffer.add(post_id, delta)
+    else:
+        _increment(post_id, likes=delta)
+
+
+@retry_on_busy
+def like_post(user, post: Post) -> bool:
+    """Ставит лайк и увеличивает счетчик, False если лайк уже был."""
+    try:
+        with transaction.atomic():
+            Like.objects.create(user=user, post=post)
+            bump_likes(post.pk, 1)
+    except IntegrityError:
+        return False
+    return True
+
+
+@retry_on_busy
+def unlike_post(user, post: Post) -> bool:
+    """Снимает лайк и уменьшает счетчик, False если лайка не было."""
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(user=user, post=post).delete()
+        if deleted:
+            bump_likes(post.pk, -deleted)
+    return bool(deleted)
+
+
+@retry_on_busy
+def add_comment(comment: Comment) -> Comment:
+    """Сохраняет комментарий и увеличивает счетчик комментариев поста."""
+    with transaction.atomic():
+        comment.save()
+        _increment(comment.post_id, comments=1)
+    return comment
+
+
+def _batches(items, size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _apply_batch(comments: Counter, likes: Counter) -> None:
+    """Один UPDATE счетчиков на пост пачки; вызывается в ее транзакции."""
+    for post_id in comments.keys() | likes.keys():
+        _increment(post_id, likes=likes[post_id], comments=comments[post_id])
+
+
+def _invalidate(post_ids) -> None:
+    # bulk_create не шлет сигналы, поэтому кэш постов сбрасывается здесь,
+    # как в signals.post_counter_changed
+    rows = Post.objects.filter(pk__in=post_ids).values_list(
+        'pk', 'group_id', 'author__username')
+    for post_id, group_id, username in rows:
+        invalidate_post_pages(post_id, group_id, username=username)
+
+
+def bulk_add_comments(comments, batch_size: int = None) -> int:
+    """Сохраняет несохраненные Comment пачками: INSERT на пачку и по
+    одному UPDATE счетчика на затронутый пост. Возвращает число
+    комментариев."""
+    total = 0
+    for batch in _batches(comments,
+                          batch_size or settings.BULK_WRITE_BATCH_SIZE):
+        per_post = Counter(comment.post_id for comment in batch)
+        with transaction.atomic():
+            Comment.objects.bulk_create(batch)
+            _apply_batch(per_post, Counter())
+        _invalidate(per_post)
+        total += len(batch)
+    return total
+
+
+def bulk_like(pairs, batch_size: int = None) -> int:
+    """Ставит лайки по парам (user_id, post_id) пачками, пропуская уже
+    поставленные, свои посты и несуществующие посты. Гонку с лайком,
+    поставленным в это же время, гасит ignore_conflicts, а счетчик
+    тогда поправит reconcile_counters. Возвращает число новых лайков."""
+    total = 0
+    for batch in _batches(pairs,
+                          batch_size or settings.BULK_WRITE_BATCH_SIZE):
+        batch = set(batch)
+        with transaction.atomic():
+            authors = dict(Post.objects.filter(
+                pk__in={post_id for _, post_id in batch}
+            ).values_list('pk', 'author_id'))
+            existing = set(Like.objects.filter(
+                post_id__in=authors,
+                user_id__in={user_id for user_id, _ in batch},
+            ).values_list('user_id', 'post_id'))
+            new = [(user_id, post_id) for user_id, post_id in batch
+                   if post_id in authors and authors[post_id] != user_id
+                   and (user_id, post_id) not in existing]
+            Like.objects.bulk_create(
+                [Like(user_id=user_id, post_id=post_id)
+                 for user_id, post_id in new],
+                ignore_conflicts=True)
+            per_post = Counter(post_id for _, post_id in new)
+            _apply_batch(Counter(), per_post)
+        _invalidate(per_post)
+        total += len(new)
+    return total
+
+
+def _count_subquery(model) -> Coalesce:
+    counts = model.objects.filter(post=OuterRef('pk')).order_by().values(
+        'post').annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def reconcile_counters() -> int:
+    """Одним UPDATE чинит разошедшиеся счетчики, возвращает число постов.
+    score после этого пересчитывает trending.recompute_scores()."""
+    likes = _count_subquery(Like)
+    comments = _count_subquery(Comment)
+    return Post.objects.filter(
+        ~Q(likes_count=likes) | ~Q(comments_count=comments)
+    ).update(likes_count=likes, comments_count=comments)
@@ -0,0 +1,261 @@
+"""Потоковые выгрузка и загрузка данных постов в JSONL.
+
+Каждая строка - одна запись {"model": ..., "pk": ..., "fields": {...}},
+модели идут в порядке внешних ключей. Картинки либо остаются ссылками
+на файлы в хранилище, либо вкладываются строками {"model": "file"}.
+В памяти одновременно держится одна пачка, каким бы ни был объем."""
+import base64
+import datetime
+import json
+import os
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import UniqueConstraint
+
+from . import invalidation
+from .models import Comment, Follow, Group, ImageBlob, Like, Post
+from .search import get_search_backend
+from .stats import rebuild_stats
+from .storage import is_hashed, recount_references
+from .timeline import rebuild_timelines
+
+User = get_user_model()
+
+FILE = 'file'
+
+# (имя в выгрузке, модель, поля); внешние ключи - по attname
+MODELS = (
+    ('user', User, ('username', 'password', 'first_name', 'last_name',
+                    'email', 'is_active', 'is_staff', 'is_superuser',
+                    'last_login', 'date_joined')),
+    ('group', Group, ('title', 'slug', 'description')),
+    ('post', Post, ('text', 'pub_date', 'author_id', 'group_id', 'image',
+                    'image_width', 'image_height', 'likes_count',
+                    'comments_count', 'score')),
+    ('comment', Comment, ('text', 'created', 'author_id', 'post_id')),
+    ('follow', Follow, ('user_id', 'author_id')),
+    ('like', Like, ('user_id', 'post_id')),
+)
+MODEL_FIELDS = {name: (model, fields) for name, model, fields in MODELS}
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не сериализуется')
+
+
+def _line(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, default=_encode) + '\n'
+
+
+def _image_storage():
+    return Post._meta.get_field('image').storage
+
+
+def export_dataset(stream, include_media=False, chunk_size=2000) -> dict:
+    """Пишет все модели MODELS в stream построчно, читая базу через
+    iterator(chunk_size). С include_media перед постами идут файлы
+    картинок в base64, каждый уникальный файл один раз.
+    Возвращает {имя модели: число строк}."""
+    counts = {}
+    for name, model, fields in MODELS:
+        if name == 'post' and include_media:
+            counts[FILE] = _export_files(stream, chunk_size)
+        rows = model.objects.order_by('pk').values_list('pk', *fields)
+        counts[name] = 0
+        for pk, *values in rows.iterator(chunk_size=chunk_size):
+            stream.write(_line({'model': name, 'pk': pk,
+                                'fields': dict(zip(fields, values))}))
+            counts[name] += 1
+    return counts
+
+
+def _export_files(stream, chunk_size) -> int:
+    storage = _image_storage()
+    names = Post.objects.exclude(image='').order_by('image').values_list(
+        'image', flat=True).distinct()
+    count = 0
+    for name in names.iterator(chunk_size=chunk_size):
+        try:
+            with storage.open(name) as image:
+                data = base64.b64encode(image.read()).decode()
+        except OSError:
+            continue
+        stream.write(_line({'model': FILE, 'name': name, 'data': data}))
+        count += 1
+    return count
+
+
+@contextmanager
+def _preserved_dates():
+    """bulk_create проставил бы auto_now_add-полям текущее время,
+    а при загрузке нужны даты из выгрузки."""
+    fields = [field for _, model, _ in MODELS
+              for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _build(name: str, record: dict):
+    model, fields = MODEL_FIELDS[name]
+    values = {field: model._meta.get_field(field).to_python(
+        record['fields'].get(field)) for field in fields}
+    return model(pk=record['pk'], **values)
+
+
+def _store_file(record: dict) -> None:
+    storage = _image_storage()
+    name = record['name']
+    if storage.exists(name):
+        return
+    # имя уже из хеша содержимого, поэтому пишем мимо storage.save
+    path = storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as image:
+        image.write(base64.b64decode(record['data']))
+
+
+def _unique_fields(model) -> list:
+    """Наборы attname, уникальные помимо первичного ключа."""
+    meta = model._meta
+    sets = [(field.attname,) for field in meta.concrete_fields
+            if field.unique and not field.primary_key]
+    sets += [tuple(meta.get_field(field).attname
+                   for field in constraint.fields)
+             for constraint in meta.constraints
+             if isinstance(constraint, UniqueConstraint)
+             and constraint.condition is None]
+    return sets
+
+
+def _taken(model, rows, fields) -> set:
+    """Значения fields строк rows, которые в базе уже заняты."""
+    values = {tuple(getattr(row, field) for field in fields) for row in rows}
+    # по каждому полю отдельный IN, сами сочетания сверяются здесь
+    lookups = {f'{field}__in': {value[number] for value in values}
+               for number, field in enumerate(fields)}
+    return values & set(model.objects.filter(**lookups).values_list(*fields))
+
+
+def _importable(name: str, rows: list, skipped: dict, report) -> list:
+    """Строки, которые можно вставить. Пропускаются и передаются в
+    report ссылки на пропущенные строки и занятые уникальные значения:
+    INSERT OR IGNORE молча отбросил бы такие строки вместе с
+    зависимыми."""
+    model, fields = MODEL_FIELDS[name]
+    names = {model: name for name, model, _ in MODELS}
+    references = {field: names[model._meta.get_field(field).related_model]
+                  for field in fields if model._meta.get_field(field)
+                  .is_relation}
+    kept = []
+    for row in rows:
+        missing = [field for field, target in references.items()
+                   if getattr(row, field) in skipped.get(target, ())]
+        if missing:
+            skipped.setdefault(name, set()).add(row.pk)
+            report(f'{name} {row.pk}: пропущены строки, на которые он '
+                   f'ссылается ({", ".join(missing)})')
+        else:
+            kept.append(row)
+    for unique in _unique_fields(model):
+        if not kept:
+            break
+        taken = _taken(model, kept, unique)
+        if not taken:
+            continue
+        rows, kept = kept, []
+        for row in rows:
+            value = tuple(getattr(row, field) for field in unique)
+            if value in taken:
+                skipped.setdefault(name, set()).add(row.pk)
+                report(f'{name} {row.pk}: {", ".join(unique)} = '
+                       f'{", ".join(map(str, value))} уже занято')
+            else:
+                kept.append(row)
+    return kept
+
+
+def _flush(name: str, batch: list, skipped: dict, report) -> int:
+    """Вставляет строки пачки, которых еще нет по первичному ключу,
+    возвращает их число."""
+    model, _ = MODEL_FIELDS[name]
+    existing = set(model.objects.filter(
+        pk__in=[row.pk for row in batch]).values_list('pk', flat=True))
+    rows = _importable(
+        name, [row for row in batch if row.pk not in existing],
+        skipped, report)
+    with transaction.atomic():
+        model.objects.bulk_create(rows)
+        if name == 'post':
+            ImageBlob.objects.bulk_create(
+                [ImageBlob(name=post.image.name) for post in rows
+                 if is_hashed(post.image.name)],
+                ignore_conflicts=True)
+    return len(rows)
+
+
+def import_dataset(lines, batch_size=500, report=None) -> dict:
+    """Загружает строки выгрузки пачками bulk_create. Уже существующие
+    по первичному ключу строки пропускаются молча, а строки с занятыми
+    уникальными значениями и зависящие от них - с сообщением в
+    report(message). Сигналы при этом не срабатывают, поэтому ленты,
+    поиск, счетчики авторов и ссылки на файлы пересобираются в конце.
+    Возвращает {имя модели: число вставленных строк}."""
+    report = report or (lambda message: None)
+    counts, skipped = {}, {}
+    name, batch = None, []
+    with _preserved_dates():
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['model'] == FILE:
+                _store_file(record)
+                counts[FILE] = counts.get(FILE, 0) + 1
+                continue
+            if batch and (record['model'] != name
+                          or len(batch) >= batch_size):
+                counts[name] = counts.get(name, 0) + _flush(
+                    name, batch, skipped, report)
+                batch = []
+            name = record['model']
+            batch.append(_build(name, record))
+        if batch:
+            counts[name] = counts.get(name, 0) + _flush(
+                name, batch, skipped, report)
+    _reset_sequences()
+    _rebuild_derived()
+    return counts
+
+
+def _reset_sequences() -> None:
+    # после вставки с явными pk, как в loaddata
+    statements = connection.ops.sequence_reset_sql(
+        no_style(), [model for _, model, _ in MODELS])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def _rebuild_derived() -> None:
+    rebuild_timelines()
+    get_search_backend().rebuild()
+    rebuild_stats()
+    recount_references()
+    namespaces = [invalidation.feed()]
+    namespaces += [invalidation.group(slug) for slug
+                   in Group.objects.values_list('slug', flat=True).iterator()]
+    invalidation.bump(*namespaces)
+    usernames = User.objects.values_list('username', flat=True)
+    for username in usernames.iterator():
+        invalidation.bump(invalidation.author(username))
@@ -0,0 +1,50 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.DB_EXECUTOR_WORKERS,
+                thread_name_prefix='posts-db')
+        return _executor
+
+
+def _run(call):
+    try:
+        return call()
+    finally:
+        # у потока пула свое соединение: закрываем его, как после запроса
+        close_old_connections()
+
+
+def fetched(queryset):
+    """Вычисляет queryset сразу, чтобы запрос ушел в потоке пула."""
+    len(queryset)
+    return queryset
+
+
+def gather(*calls) -> list:
+    """Выполняет независимые чтения одновременно и возвращает их
+    результаты по порядку. Первое выполняется в потоке запроса,
+    остальные - в пуле DB_EXECUTOR_WORKERS потоков.
+
+    Внутри транзакции другие соединения не видят ее изменений,
+    поэтому там, как и при DB_EXECUTOR_WORKERS = 0, все идет по очереди."""
+    if (len(calls) < 2 or not settings.DB_EXECUTOR_WORKERS
+            or connection.in_atomic_block):
+        return [call() for call in calls]
+    # контекст переносится, чтобы потоки читали с той же реплики
+    futures = [get_executor().submit(contextvars.copy_context().run,
+                                     _run, call) for call in calls[1:]]
+    first = calls[0]()
+    return [first] + [future.result() for future in futures]
@@ -16,6 +16,32 @@ class PostForm(forms.ModelForm):
             'group': 'Группа',
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # файл, отвергнутый posts.uploads, до ImageField не доходит:
+        # иначе вместо причины было бы «загрузите правильное изображение»
+        image = self.files.get('image')
+        self.upload_error = getattr(image, 'upload_error', None)
+        if self.upload_error:
+            self.files = self.files.copy()
+            del self.files['image']
+
+    def clean_image(self):
+        if self.upload_error:
+            raise forms.ValidationError(self.upload_error)
+        return self.cleaned_data['image']
+
+    def save(self, commit=True):
+        if 'image' in self.changed_data:
+            image = self.cleaned_data['image']
+            # размеры уже прочитаны из заголовка: posts.uploads
+            # или ImageField, если файл пришел не через него
+            size = getattr(image, 'image_size', None) or getattr(
+                getattr(image, 'image', None), 'size', None)
+            self.instance.image_width, self.instance.image_height = (
+                size or (None, None))
+        return super().save(commit)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,10 @@
+from . import invalidation
+
+
+def annotate_card_versions(posts) -> None:
+    """Проставляет постам card_version для ключа {% cache %} одним
+    запросом к кэшу: это поколение пространства имен поста."""
+    versions = invalidation.generations(
+        invalidation.post(post.pk) for post in posts)
+    for post in posts:
+        post.card_version = versions[invalidation.post(post.pk)]
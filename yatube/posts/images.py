@@ -0,0 +1,185 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection
+from PIL import Image
+
+from .models import Post, Thumbnail
+from .signals import invalidate_post_pages
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_KEY = 'thumbnails:{}'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.POST_IMAGE_WORKERS)
+        return _pool
+
+
+def thumbnail_sizes() -> list:
+    return sorted(set(settings.POST_IMAGE_SIZES.values()), reverse=True)
+
+
+def thumbnail_name(source: str, size: int, image_format: str) -> str:
+    stem, _ = os.path.splitext(source)
+    return f'thumbs/{stem}_{size}.{image_format}'
+
+
+def render_variants(data: bytes, sizes, formats) -> list:
+    """Превью всех размеров и форматов: [(size, format, bytes, w, h)].
+    Выполняется в дочернем процессе, поэтому работает только с байтами."""
+    with Image.open(BytesIO(data)) as original:
+        image = original.convert('RGB')
+    variants = []
+    for size in sizes:
+        # картинки меньше заказанной ширины не растягиваем
+        width = min(size, image.width)
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        for image_format in formats:
+            buffer = BytesIO()
+            resized.save(buffer, image_format.upper(), quality=85)
+            variants.append(
+                (size, image_format, buffer.getvalue(), width, height))
+    return variants
+
+
+def store_variants(source: str, variants) -> None:
+    """Сохраняет файлы превью и их размеры, сбрасывает кэш постов
+    с этой картинкой."""
+    for size, image_format, data, width, height in variants:
+        name = thumbnail_name(source, size, image_format)
+        default_storage.delete(name)
+        name = default_storage.save(name, ContentFile(data))
+        Thumbnail.objects.update_or_create(
+            source=source, size=size, format=image_format,
+            defaults={'image': name, 'width': width, 'height': height})
+    cache.delete(_cache_key(source))
+    posts = Post.objects.filter(image=source).values_list(
+        'pk', 'group_id', 'author__username')
+    for post_id, group_id, username in posts:
+        invalidate_post_pages(post_id, group_id, username=username)
+
+
+def delete_thumbnails(source: str) -> None:
+    thumbs = Thumbnail.objects.filter(source=source)
+    for thumb in thumbs:
+        thumb.image.delete(save=False)
+    thumbs.delete()
+    cache.delete(_cache_key(source))
+
+
+def has_thumbnails(source: str) -> bool:
+    """Все ли превью уже построены, например для такой же картинки
+    другого поста."""
+    sizes = thumbnail_sizes()
+    formats = settings.POST_IMAGE_FORMATS
+    return Thumbnail.objects.filter(
+        source=source, size__in=sizes, format__in=formats
+    ).count() >= len(sizes) * len(formats)
+
+
+def _store_result(source, future):
+    try:
+        store_variants(source, future.result())
+    except Exception:
+        logger.exception('Не удалось сохранить превью %s', source)
+    finally:
+        close_old_connections()
+
+
+def process_image(source: str) -> None:
+    """Строит превью картинки в пуле POST_IMAGE_WORKERS процессов.
+    Внутри транзакции и при POST_IMAGE_WORKERS = 0 - сразу в потоке
+    запроса: фоновое соединение не увидело бы несохраненный пост."""
+    if not source or has_thumbnails(source):
+        return
+    try:
+        with default_storage.open(source) as image_file:
+            data = image_file.read()
+    except OSError:
+        logger.warning('Картинка %s не найдена', source)
+        return
+    args = (data, thumbnail_sizes(), settings.POST_IMAGE_FORMATS)
+    if not settings.POST_IMAGE_WORKERS or connection.in_atomic_block:
+        try:
+            variants = render_variants(*args)
+        except (OSError, ValueError):
+            logger.warning('Не удалось построить превью %s', source)
+            return
+        store_variants(source, variants)
+        return
+    future = get_pool().submit(render_variants, *args)
+    future.add_done_callback(partial(_store_result, source))
+
+
+def _cache_key(source: str) -> str:
+    return THUMBNAILS_KEY.format(
+        hashlib.md5(source.encode()).hexdigest())
+
+
+def _variants(thumbs: dict) -> dict:
+    """{имя размера: {формат: {url, width, height}}} или {},
+    если построены не все превью."""
+    sizes = settings.POST_IMAGE_SIZES
+    formats = settings.POST_IMAGE_FORMATS
+    if len(thumbs) < len(set(sizes.values())) * len(formats):
+        return {}
+    return {
+        label: {image_format: {'url': thumbs[size, image_format].url,
+                               'width': thumbs[size, image_format].width,
+                               'height': thumbs[size, image_format].height}
+                for image_format in formats}
+        for label, size in sizes.items()
+    }
+
+
+def resolve_thumbnails(sources) -> dict:
+    """Превью всех картинок страницы: {имя файла: {имя размера: {формат:
+    {url, width, height}}}}. Один get_many из кэша, недостающее - одним
+    запросом к базе. Картинки без готовых превью в ответ не попадают."""
+    sources = {source for source in sources if source}
+    if not sources:
+        return {}
+    keys = {_cache_key(source): source for source in sources}
+    resolved = {keys[key]: variants for key, variants
+                in cache.get_many(list(keys)).items()}
+    missing = sources - resolved.keys()
+    if missing:
+        found = defaultdict(dict)
+        for thumb in Thumbnail.objects.filter(
+                source__in=missing,
+                size__in=settings.POST_IMAGE_SIZES.values(),
+                format__in=settings.POST_IMAGE_FORMATS):
+            found[thumb.source][thumb.size, thumb.format] = thumb
+        fresh = {source: _variants(found[source]) for source in missing}
+        cache.set_many({_cache_key(source): variants
+                        for source, variants in fresh.items() if variants},
+                       settings.THUMBNAIL_CACHE_TIMEOUT)
+        # пустой ответ живет недолго: читатель мог записать его уже после
+        # того, как store_variants сбросил ключ
+        cache.set_many({_cache_key(source): variants
+                        for source, variants in fresh.items()
+                        if not variants},
+                       settings.THUMBNAIL_MISSING_CACHE_TIMEOUT)
+        resolved.update(fresh)
+    return {source: variants for source, variants in resolved.items()
+            if variants}
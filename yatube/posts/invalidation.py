@@ -0,0 +1,98 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .routers import current_replica
+
+GENERATION_KEY = 'generation:{}'
+PAGE_KEY = 'page:{}'
+
+
+def feed() -> str:
+    return 'feed'
+
+
+def group(slug: str) -> str:
+    return f'group:{slug}'
+
+
+def author(username: str) -> str:
+    return f'author:{username}'
+
+
+def post(post_id: int) -> str:
+    return f'post:{post_id}'
+
+
+def _generation_key(namespace: str) -> str:
+    # в пространствах имен слаги и имена пользователей, а кириллица
+    # и пробелы в ключах memcached недопустимы
+    return GENERATION_KEY.format(hashlib.md5(namespace.encode()).hexdigest())
+
+
+def _seed(key: str) -> None:
+    # вытесненный из кэша счетчик начинается не с нуля, а со времени:
+    # иначе он повторил бы старые поколения и ожили бы старые страницы
+    cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump(*namespaces) -> None:
+    """Сдвигает поколения пространств имен: все ключи, собранные
+    со старыми поколениями, больше не читаются и вытесняются по TTL."""
+    for namespace in set(namespaces):
+        key = _generation_key(namespace)
+        _seed(key)
+        cache.incr(key)
+
+
+def generations(namespaces) -> dict:
+    keys = {_generation_key(namespace): namespace
+            for namespace in namespaces}
+    stored = cache.get_many(list(keys))
+    missing = [key for key in keys if key not in stored]
+    if missing:
+        for key in missing:
+            _seed(key)
+        stored.update(cache.get_many(missing))
+    return {namespace: stored.get(key, 0) for key, namespace in keys.items()}
+
+
+def page_cache_key(request, namespaces, variant=None) -> str:
+    stamp = ';'.join(f'{namespace}={generation}' for namespace, generation
+                     in sorted(generations(namespaces).items()))
+    path = variant(request) if variant else request.get_full_path()
+    digest = hashlib.md5(f'{path}|{stamp}'.encode()).hexdigest()
+    return PAGE_KEY.format(digest)
+
+
+def _page_timeout() -> int:
+    # реплика может еще не догнать сбросившую поколение запись: такая
+    # страница живет не дольше, чем допускается отставание реплики
+    if current_replica() is not None:
+        return settings.REPLICA_STICKY_SECONDS
+    return settings.PAGE_CACHE_TIMEOUT
+
+
+def cache_public_page(namespaces, variant=None):
+    """Кэширует страницу для анонимных посетителей, пока не сменилось
+    поколение одного из пространств имен namespaces(**view_kwargs).
+    variant(request) - канонический вид адреса для ключа, по умолчанию
+    полный путь с параметрами.
+    Авторизованным страница рендерится заново: в ней есть их кнопки."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            key = page_cache_key(request, namespaces(**kwargs), variant)
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200:
+                    cache.set(key, response, _page_timeout())
+            return response
+        return wrapper
+    return decorator
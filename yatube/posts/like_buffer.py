@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Post
+from .trending import score_change
+
+DELTA_KEY = 'likes_delta:{}'
+DIRTY_KEY = 'likes_dirty:{}'
+# кэш не умеет атомарно хранить множества, поэтому затронутые посты
+# пишутся в журнал из пронумерованных ключей, по разу до сброса
+JOURNAL_KEY = 'likes_journal:{}'
+JOURNAL_SEQ_KEY = 'likes_journal_seq'
+FLUSHED_SEQ_KEY = 'likes_flushed_seq'
+# add() сбрасывает буфер не чаще раза в LIKES_BUFFER_FLUSH_INTERVAL
+FLUSH_THROTTLE_KEY = 'likes_flush_throttle'
+FLUSH_LOCK_KEY = 'likes_flush_lock'
+
+
+def is_enabled() -> bool:
+    return settings.LIKES_BUFFER_ENABLED
+
+
+def _cache():
+    return caches[settings.LIKES_BUFFER_CACHE]
+
+
+def _incr(cache, key: str, delta: int) -> int:
+    cache.add(key, 0, timeout=None)
+    return cache.incr(key, delta)
+
+
+def add(post_id: int, delta: int) -> None:
+    """Запоминает изменение счетчика и при необходимости сбрасывает буфер."""
+    cache = _cache()
+    _incr(cache, DELTA_KEY.format(post_id), delta)
+    if cache.add(DIRTY_KEY.format(post_id), True, timeout=None):
+        seq = _incr(cache, JOURNAL_SEQ_KEY, 1)
+        cache.set(JOURNAL_KEY.format(seq), post_id, timeout=None)
+    if cache.add(FLUSH_THROTTLE_KEY, True,
+                 timeout=settings.LIKES_BUFFER_FLUSH_INTERVAL):
+        flush()
+
+
+def pending(post_ids) -> dict:
+    """Несброшенные дельты для списка постов: {post_id: delta}."""
+    keys = {DELTA_KEY.format(post_id): post_id for post_id in post_ids}
+    return {keys[key]: delta
+            for key, delta in _cache().get_many(list(keys)).items() if delta}
+
+
+def apply_pending(posts) -> None:
+    """Добавляет к likes_count постов страницы их несброшенные дельты."""
+    if not is_enabled():
+        return
+    deltas = pending([post.pk for post in posts])
+    for post in posts:
+        post.likes_count += deltas.get(post.pk, 0)
+
+
+def _take(cache, post_ids) -> dict:
+    """Забирает дельты из буфера до записи в базу: то, что add()
+    добавит после этого, останется следующему сбросу."""
+    deltas = pending(post_ids)
+    for post_id, delta in deltas.items():
+        _incr(cache, DELTA_KEY.format(post_id), -delta)
+    return deltas
+
+
+def flush() -> int:
+    """Сбрасывает накопленные дельты в базу, возвращает число постов.
+    Сбросы не идут одновременно: пока идет один, например из add(),
+    другой, например flush_likes, ничего не делает и возвращает 0."""
+    cache = _cache()
+    if not cache.add(FLUSH_LOCK_KEY, True,
+                     timeout=settings.LIKES_BUFFER_LOCK_TIMEOUT):
+        return 0
+    try:
+        return _flush(cache)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+
+def _flush(cache) -> int:
+    last = cache.get(JOURNAL_SEQ_KEY, 0)
+    first = cache.get(FLUSHED_SEQ_KEY, 0) + 1
+    if last < first:
+        return 0
+    journal = cache.get_many(
+        [JOURNAL_KEY.format(seq) for seq in range(first, last + 1)])
+    # add() берет номер раньше, чем пишет запись: на первом пропуске
+    # останавливаемся, и запись с ним и после него дочитает следующий сброс
+    journal_keys = []
+    for seq in range(first, last + 1):
+        if JOURNAL_KEY.format(seq) not in journal:
+            break
+        journal_keys.append(JOURNAL_KEY.format(seq))
+    if not journal_keys:
+        return 0
+    post_ids = {journal[key] for key in journal_keys}
+    cache.delete_many([DIRTY_KEY.format(post_id) for post_id in post_ids])
+    deltas = _take(cache, post_ids)
+    if deltas:
+        change = Case(
+            *(When(pk=post_id, then=Value(delta))
+              for post_id, delta in deltas.items()),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        try:
+            Post.objects.filter(pk__in=deltas).update(
+                likes_count=F('likes_count') + change,
+                score=score_change(likes=change),
+            )
+        except Exception:
+            # несохраненные дельты возвращаются в буфер
+            for post_id, delta in deltas.items():
+                _incr(cache, DELTA_KEY.format(post_id), delta)
+            raise
+    cache.set(FLUSHED_SEQ_KEY, first + len(journal_keys) - 1, timeout=None)
+    cache.delete_many(journal_keys)
+    return len(deltas)
@@ -0,0 +1,44 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from posts.models import Post
+from posts.signals import invalidate_post_pages
+
+
+class Command(BaseCommand):
+    help = ('Записывает размеры уже загруженных картинок постов '
+            'в image_width и image_height, читая только заголовки файлов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='перечитать и уже заполненные размеры')
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            posts = posts.filter(image_width__isnull=True)
+        names = posts.values_list('image', flat=True).distinct()
+        updated = missing = 0
+        for name in list(names):
+            try:
+                with storage.open(name) as image_file, \
+                        Image.open(image_file) as image:
+                    width, height = image.size
+            except (OSError, SyntaxError, ValueError,
+                    SuspiciousFileOperation):
+                # битые и пропавшие файлы, пути вне MEDIA_ROOT
+                missing += 1
+                self.stderr.write(f'Не удалось прочитать {name}')
+                continue
+            changed = Post.objects.filter(image=name)
+            rows = list(changed.values_list(
+                'pk', 'group_id', 'author__username'))
+            changed.update(image_width=width, image_height=height)
+            for post_id, group_id, username in rows:
+                invalidate_post_pages(post_id, group_id, username=username)
+            updated += len(rows)
+        self.stdout.write(self.style.SUCCESS(
+            f'Размеры записаны у постов: {updated}, '
+            f'не прочитано картинок: {missing}'))
@@ -0,0 +1,76 @@
+import random
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from posts import like_buffer
+from posts.counters import bump_likes
+from posts.models import Post
+
+User = get_user_model()
+
+
+class RowCounter:
+    """execute_wrapper, считающий строки, записанные в posts_post."""
+
+    def __init__(self):
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if sql.startswith(f'UPDATE "{Post._meta.db_table}"'):
+            self.rows += context['cursor'].rowcount
+        return result
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает число строк posts_post, записанных счетчиком лайков '
+            'с буфером и без него. Все изменения откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--likes', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=10,
+                            help='число «горячих» постов')
+        parser.add_argument('--flush-every', type=int, default=1000,
+                            help='лайков между сбросами буфера')
+
+    def run(self, post_ids, likes, flush_every):
+        counter = RowCounter()
+        with connection.execute_wrapper(counter):
+            for number in range(1, likes + 1):
+                bump_likes(random.choice(post_ids), 1)
+                if like_buffer.is_enabled() and number % flush_every == 0:
+                    like_buffer.flush()
+            if like_buffer.is_enabled():
+                like_buffer.flush()
+        return counter.rows
+
+    def handle(self, *args, **options):
+        likes = options['likes']
+        caches = dict(settings.CACHES, like_benchmark={
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'like-benchmark',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        })
+        with transaction.atomic():
+            author = User.objects.create_user(username='like-benchmark')
+            post_ids = [
+                Post.objects.create(author=author, text='benchmark').pk
+                for _ in range(options['posts'])
+            ]
+            with override_settings(LIKES_BUFFER_ENABLED=False):
+                direct = self.run(post_ids, likes, options['flush_every'])
+            with override_settings(
+                CACHES=caches,
+                LIKES_BUFFER_ENABLED=True,
+                LIKES_BUFFER_CACHE='like_benchmark',
+                LIKES_BUFFER_FLUSH_INTERVAL=None,
+            ):
+                buffered = self.run(post_ids, likes, options['flush_every'])
+            transaction.set_rollback(True)
+        self.stdout.write(f'Лайков: {likes}, постов: {options["posts"]}')
+        self.stdout.write(f'Без буфера записано строк: {direct}')
+        self.stdout.write(f'С буфером записано строк: {buffered}')
@@ -0,0 +1,150 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.sqlite import apply_pragmas, is_busy, retry_on_busy
+
+
+class Workload:
+    """Писатели и читатели над временной базой с таблицей постов.
+
+    Без настройки каждая операция открывает свое соединение, как при
+    CONN_MAX_AGE = 0, и ошибки блокировки не повторяются; с настройкой
+    у потока одно соединение с прагмами SQLITE_PRAGMAS, а записи идут
+    через retry_on_busy."""
+
+    def __init__(self, path, tuned):
+        self.path = path
+        self.tuned = tuned
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.writes = self.errors = 0
+        self.latencies = []
+
+    def connect(self):
+        db = sqlite3.connect(self.path, isolation_level=None,
+                             check_same_thread=False)
+        if self.tuned:
+            apply_pragmas(db, settings.SQLITE_PRAGMAS)
+        return db
+
+    def connection(self):
+        if not self.tuned:
+            return self.connect()
+        if not hasattr(self.local, 'db'):
+            self.local.db = self.connect()
+        return self.local.db
+
+    def release(self, db):
+        if not self.tuned:
+            db.close()
+
+    def like(self, post_id):
+        # чтение перед записью, как у get_or_create и счетчиков
+        db = self.connection()
+        try:
+            db.execute('BEGIN')
+            try:
+                db.execute('SELECT likes FROM post WHERE id = ?',
+                           (post_id,)).fetchone()
+                db.execute('UPDATE post SET likes = likes + 1 WHERE id = ?',
+                           (post_id,))
+                db.execute('COMMIT')
+            except sqlite3.Error:
+                db.execute('ROLLBACK')
+                raise
+        finally:
+            self.release(db)
+
+    def write(self, posts, deadline):
+        like = retry_on_busy(self.like) if self.tuned else self.like
+        while time.monotonic() < deadline:
+            try:
+                like(random.randint(1, posts))
+            except sqlite3.OperationalError as error:
+                if not is_busy(error):
+                    raise
+                with self.lock:
+                    self.errors += 1
+            else:
+                with self.lock:
+                    self.writes += 1
+
+    def read(self, deadline):
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            db = self.connection()
+            try:
+                db.execute('SELECT id, text, likes FROM post '
+                           'ORDER BY likes DESC, id DESC LIMIT 10').fetchall()
+            finally:
+                self.release(db)
+            with self.lock:
+                self.latencies.append(time.perf_counter() - started)
+
+    def p99(self) -> float:
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[int(len(latencies) * 0.99)] * 1000
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает записи в секунду и p99 чтения SQLite без настроек '
+            'posts.sqlite и с ними: несколько потоков пишут и читают одну '
+            'временную базу. Рабочая база не затрагивается')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--posts', type=int, default=1000)
+
+    def prepare(self, path, posts):
+        db = sqlite3.connect(path, isolation_level=None)
+        db.execute('CREATE TABLE post (id INTEGER PRIMARY KEY, '
+                   'text TEXT NOT NULL, likes INTEGER NOT NULL)')
+        db.execute('CREATE INDEX post_likes ON post (likes, id)')
+        db.executemany('INSERT INTO post (text, likes) VALUES (?, 0)',
+                       (('пост ' * 50,) for _ in range(posts)))
+        db.close()
+
+    def run(self, tuned, options) -> Workload:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.sqlite3')
+            self.prepare(path, options['posts'])
+            workload = Workload(path, tuned)
+            deadline = time.monotonic() + options['seconds']
+            threads = [
+                threading.Thread(target=workload.write,
+                                 args=(options['posts'], deadline))
+                for _ in range(options['writers'])
+            ] + [
+                threading.Thread(target=workload.read, args=(deadline,))
+                for _ in range(options['readers'])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return workload
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'Писателей: {options["writers"]}, '
+            f'читателей: {options["readers"]}, '
+            f'секунд на режим: {options["seconds"]}')
+        for title, tuned in (('Без настроек', False),
+                             ('С posts.sqlite', True)):
+            workload = self.run(tuned, options)
+            self.stdout.write(
+                f'{title}: записей в секунду '
+                f'{workload.writes / options["seconds"]:.0f}, '
+                f'ошибок блокировки {workload.errors}, '
+                f'p99 чтения {workload.p99():.2f} мс')
@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу тестовыми данными, обходит все маршруты posts, '
+            'users и about анонимом и пользователем и сравнивает число '
+            'запросов и время с baseline. Все изменения откатываются.')
+
+    def add_arguments(self, parser):
+        for name, default in benchmark.DATASET_SIZES.items():
+            parser.add_argument(f'--{name}', type=int, default=default)
+        parser.add_argument('--baseline', default=benchmark.BASELINE_PATH)
+        parser.add_argument('--update-baseline', action='store_true')
+        parser.add_argument('--query-tolerance', type=int, default=0,
+                            help='допустимый прирост числа запросов')
+        parser.add_argument('--time-tolerance', type=float, default=None,
+                            help='допустимый относительный рост времени, '
+                                 'например 0.5; по умолчанию не проверяется')
+
+    def handle(self, *args, **options):
+        sizes = {name: options[name] for name in benchmark.DATASET_SIZES}
+        with transaction.atomic():
+            dataset = benchmark.seed_dataset(sizes)
+            results = benchmark.run_benchmark(dataset, clear_cache=cache.clear)
+            transaction.set_rollback(True)
+        cache.clear()
+
+        for viewer, routes in results.items():
+            for name, metrics in sorted(routes.items()):
+                self.stdout.write(
+                    f'{viewer:<13} {name:<30} {metrics["queries"]:>4} '
+                    f'запросов {metrics["sql_time"]:>8} мс SQL '
+                    f'{metrics["render_time"]:>8} мс рендер')
+
+        if options['update_baseline']:
+            benchmark.save_baseline(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS('Baseline обновлен'))
+            return
+        regressions = benchmark.compare(
+            results, benchmark.load_baseline(options['baseline']),
+            query_tolerance=options['query_tolerance'],
+            time_tolerance=options['time_tolerance'])
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
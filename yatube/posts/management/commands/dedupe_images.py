@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.images import delete_thumbnails
+from posts.models import Post
+from posts.signals import invalidate_post_pages
+from posts.storage import is_hashed, recount_references
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в ContentAddressedStorage: '
+            'одинаковые файлы сливаются в один, старые файлы и их превью '
+            'удаляются. Превью новых файлов строит generate_thumbnails.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--purge-orphans', action='store_true',
+            help='удалить и файлы из posts/, на которые не ссылается '
+                 'ни один пост')
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        names = Post.objects.exclude(image='').values_list(
+            'image', flat=True).distinct()
+        moved = missing = 0
+        for name in [name for name in names if not is_hashed(name)]:
+            if not storage.exists(name):
+                missing += 1
+                self.stderr.write(f'Нет файла {name}')
+                continue
+            with storage.open(name) as old_file:
+                new_name = storage.save(name, old_file)
+            with transaction.atomic():
+                posts = Post.objects.filter(image=name)
+                updated = list(posts.values_list(
+                    'pk', 'group_id', 'author__username'))
+                posts.update(image=new_name)
+            for post_id, group_id, username in updated:
+                invalidate_post_pages(post_id, group_id, username=username)
+            delete_thumbnails(name)
+            storage.delete(name)
+            moved += 1
+        blobs = recount_references()
+
+        purged = 0
+        if options['purge_orphans']:
+            referenced = set(Post.objects.values_list('image', flat=True))
+            _, files = storage.listdir('posts')
+            for filename in files:
+                name = f'posts/{filename}'
+                if name not in referenced:
+                    storage.delete(name)
+                    purged += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено картинок: {moved}, уникальных файлов: {blobs}, '
+            f'не найдено: {missing}, удалено лишних: {purged}'))
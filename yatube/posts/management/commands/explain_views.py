@@ -0,0 +1,88 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.models import Comment, Group, Post
+from posts.timeline import TIMELINE_ORDERING, timeline_posts
+from posts.utils import (COMMENTS_ORDERING, POSTS_ORDERING, SORT_MODES,
+                         post_cards)
+
+User = get_user_model()
+
+# SQLite: "SEARCH t USING INDEX x", PostgreSQL: "Index Scan using x"
+INDEX_RE = re.compile(
+    r'USING (?:COVERING )?INDEX (\w+)|Index (?:Only )?Scan (?:Backward )?'
+    r'using (\w+)')
+FULL_SCAN_RE = re.compile(r'\bSCAN (\w+)\s*$|Seq Scan on (\w+)',
+                          re.MULTILINE)
+SORT_RE = re.compile(r'USE TEMP B-TREE|(?:^|->)\s*(?:Incremental )?Sort\b',
+                     re.MULTILINE)
+
+
+def view_queries():
+    """(название, queryset) главного запроса каждой страницы-списка."""
+    group = Group.objects.first()
+    slug = group.slug if group else ''
+    author_id = User.objects.values_list('pk', flat=True).first() or 0
+    post_id = Post.objects.values_list('pk', flat=True).first() or 0
+    for order, mode in SORT_MODES.items():
+        yield (f'posts:index ?orderby={order}',
+               post_cards().order_by(*mode.ordering))
+    yield ('posts:group_list', post_cards(
+        Post.objects.filter(group__slug=slug)).order_by(*POSTS_ORDERING))
+    yield ('posts:profile', post_cards(
+        Post.objects.filter(author_id=author_id)).order_by(*POSTS_ORDERING))
+    yield ('posts:follow_index', post_cards(
+        timeline_posts(author_id)).order_by(*TIMELINE_ORDERING))
+    yield ('posts:post_detail comments', Comment.objects.filter(
+        post_id=post_id).select_related('author').order_by(
+            *COMMENTS_ORDERING)[:settings.COMMENTS_PER_PAGE])
+
+
+def analyze(plan: str) -> dict:
+    def names(regex):
+        return sorted({next(filter(None, match.groups()))
+                       for match in regex.finditer(plan)})
+
+    return {
+        'indexes': names(INDEX_RE),
+        'full_scans': names(FULL_SCAN_RE),
+        'sorts': bool(SORT_RE.search(plan)),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Выводит EXPLAIN главного запроса каждой страницы-списка '
+            'и отмечает полные просмотры и сортировку в памяти')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--per-page', type=int, default=settings.POSTS_PER_PAGE,
+            help='LIMIT, как у страницы пагинатора')
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Ошибка, если какой-то запрос обходится без индекса '
+                 'или сортирует в памяти')
+
+    def handle(self, *args, **options):
+        problems = []
+        for name, queryset in view_queries():
+            plan = queryset[:options['per_page']].explain()
+            result = analyze(plan)
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            if result['indexes']:
+                self.stdout.write(self.style.SUCCESS(
+                    'индексы: ' + ', '.join(result['indexes'])))
+            for table in result['full_scans']:
+                problems.append(f'{name}: полный просмотр {table}')
+                self.stdout.write(self.style.WARNING(
+                    f'полный просмотр {table}'))
+            if result['sorts']:
+                problems.append(f'{name}: сортировка в памяти')
+                self.stdout.write(self.style.WARNING('сортировка в памяти'))
+            self.stdout.write('')
+        if problems and options['strict']:
+            raise CommandError('\n'.join(problems))
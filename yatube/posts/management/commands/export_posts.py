@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts.dataset import export_dataset
+
+
+class Command(BaseCommand):
+    help = ('Выгружает пользователей, группы, посты, комментарии, подписки '
+            'и лайки в JSONL, не собирая их в памяти, в отличие от dumpdata')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл JSONL или - для stdout')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument(
+            '--include-media', action='store_true',
+            help='вложить файлы картинок постов; без флага в выгрузке '
+                 'только их имена в хранилище')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            counts = export_dataset(self.stdout, options['include_media'],
+                                    options['chunk_size'])
+        else:
+            with open(options['path'], 'w', encoding='utf-8') as stream:
+                counts = export_dataset(stream, options['include_media'],
+                                        options['chunk_size'])
+        self.stderr.write(', '.join(
+            f'{name}: {count}' for name, count in counts.items()))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts import like_buffer
+
+
+class Command(BaseCommand):
+    help = 'Сбрасывает буфер лайков в Post.likes_count'
+
+    def handle(self, *args, **options):
+        count = like_buffer.flush()
+        self.stdout.write(self.style.SUCCESS(
+            f'Буфер лайков сброшен, постов обновлено: {count}'))
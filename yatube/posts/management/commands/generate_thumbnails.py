@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.test.utils import override_settings
+
+from posts.images import process_image
+from posts.models import Post, Thumbnail
+
+
+class Command(BaseCommand):
+    help = 'Строит недостающие превью для уже загруженных картинок постов'
+
+    def handle(self, *args, **options):
+        expected = len(set(settings.POST_IMAGE_SIZES.values())) * len(
+            settings.POST_IMAGE_FORMATS)
+        done = Thumbnail.objects.values('source').annotate(
+            variants=Count('pk')).filter(
+                variants__gte=expected).values_list('source', flat=True)
+        sources = Post.objects.exclude(image='').exclude(
+            image__in=done).values_list('image', flat=True).distinct()
+        count = 0
+        # по одной картинке в этом процессе, чтобы не держать в памяти все
+        with override_settings(POST_IMAGE_WORKERS=0):
+            for source in sources.iterator():
+                process_image(source)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {count}'))
@@ -0,0 +1,90 @@
+import json
+import sys
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.counters import bulk_add_comments, bulk_like
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Загружает комментарии и лайки из JSONL пачками через '
+            'bulk_add_comments и bulk_like. Строки вида '
+            '{"type": "comment", "post": 1, "author": "leo", "text": "..."} '
+            'и {"type": "like", "post": 1, "user": "leo"}')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл JSONL или - для stdin')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.BULK_WRITE_BATCH_SIZE)
+
+    def parse(self, lines):
+        """(номер строки, запись) по строкам файла, битые пропускаются."""
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if record['type'] not in ('comment', 'like'):
+                    raise ValueError(record['type'])
+                record['post'] = int(record['post'])
+            except (ValueError, KeyError, TypeError) as error:
+                self.skipped += 1
+                self.stderr.write(f'Строка {number}: {error!r}')
+                continue
+            yield number, record
+
+    def import_batch(self, batch):
+        usernames = {record.get('author') or record.get('user')
+                     for _, record in batch}
+        users = dict(User.objects.filter(
+            username__in=usernames).values_list('username', 'pk'))
+        comments, likes = [], []
+        for number, record in batch:
+            if record['type'] == 'comment':
+                user_id = users.get(record.get('author'))
+                if user_id is not None:
+                    comments.append(Comment(
+                        post_id=record['post'], author_id=user_id,
+                        text=record.get('text', '')))
+                    continue
+            else:
+                user_id = users.get(record.get('user'))
+                if user_id is not None:
+                    likes.append((user_id, record['post']))
+                    continue
+            self.skipped += 1
+            self.stderr.write(f'Строка {number}: нет пользователя')
+        # комментарии к несуществующим постам отсеиваются до INSERT
+        posts = {comment.post_id for comment in comments}
+        existing = set(Post.objects.filter(
+            pk__in=posts).values_list('pk', flat=True))
+        self.skipped += sum(comment.post_id not in existing
+                            for comment in comments)
+        self.comments += bulk_add_comments(
+            [comment for comment in comments if comment.post_id in existing])
+        self.likes += bulk_like(likes)
+
+    def import_stream(self, stream, batch_size):
+        records = self.parse(stream)
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                return
+            self.import_batch(batch)
+
+    def handle(self, *args, **options):
+        self.comments = self.likes = self.skipped = 0
+        if options['path'] == '-':
+            self.import_stream(sys.stdin, options['batch_size'])
+        else:
+            with open(options['path'], encoding='utf-8') as stream:
+                self.import_stream(stream, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Комментариев: {self.comments}, новых лайков: {self.likes}, '
+            f'пропущено строк: {self.skipped}'))
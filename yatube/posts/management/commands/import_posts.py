@@ -0,0 +1,35 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.dataset import import_dataset
+
+
+class Command(BaseCommand):
+    help = ('Загружает выгрузку export_posts пачками bulk_create и '
+            'пересобирает ленты, поиск и счетчики. Строки, которые уже '
+            'есть по первичному ключу, пропускаются; строки с занятыми '
+            'уникальными значениями и зависящие от них выводятся в stderr')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл JSONL или - для stdin')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.BULK_WRITE_BATCH_SIZE)
+
+    def report(self, message):
+        self.skipped += 1
+        self.stderr.write(message)
+
+    def handle(self, *args, **options):
+        self.skipped = 0
+        if options['path'] == '-':
+            counts = import_dataset(sys.stdin, options['batch_size'],
+                                    self.report)
+        else:
+            with open(options['path'], encoding='utf-8') as stream:
+                counts = import_dataset(stream, options['batch_size'],
+                                        self.report)
+        self.stdout.write(self.style.SUCCESS('Загружено: ' + ', '.join(
+            f'{name}: {count}' for name, count in counts.items())
+            + f', пропущено из-за конфликтов: {self.skipped}'))
@@ -0,0 +1,117 @@
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                          WSGIRequestHandler, WSGIServer)
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts import benchmark
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class SerialServer(WSGIServer):
+    """Один поток: медленный запрос к базе держит весь воркер."""
+
+    request_queue_size = 1024
+
+
+class ThreadedServer(ThreadedWSGIServer):
+    request_queue_size = 1024
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def fetch(url, cookie):
+    request = urllib.request.Request(url, headers={'Cookie': cookie})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=120) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = ('Нагружает index, group_list, profile и post_detail '
+            'одновременными авторизованными клиентами и сравнивает '
+            'задержки p50/p99: однопоточный WSGI-воркер, многопоточный '
+            'и многопоточный с параллельными чтениями страницы '
+            '(DB_EXECUTOR_WORKERS). Клиенты и сервер работают в одном '
+            'процессе, поэтому сравнивать стоит режимы между собой.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--executor-workers', type=int, default=4)
+        parser.add_argument(
+            '--seed', action='store_true',
+            help='сначала заполнить базу данными benchmark_urls; '
+                 'данные остаются в базе')
+
+    def modes(self, executor_workers):
+        return (
+            ('wsgi, 1 поток', SerialServer, 0),
+            ('wsgi, потоки', ThreadedServer, 0),
+            ('wsgi, потоки + executor', ThreadedServer, executor_workers),
+        )
+
+    def run_mode(self, server_class, urls, cookie, options):
+        server = server_class(('127.0.0.1', 0), QuietHandler)
+        server.set_app(WSGIHandler())
+        Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+        try:
+            with ThreadPoolExecutor(max_workers=options['clients']) as pool:
+                start = time.perf_counter()
+                latencies = list(pool.map(
+                    lambda number: fetch(base + urls[number % len(urls)],
+                                         cookie),
+                    range(options['requests'])))
+                elapsed = time.perf_counter() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+        return latencies, elapsed
+
+    def handle(self, *args, **options):
+        dataset = (benchmark.seed_dataset() if options['seed']
+                   else benchmark.load_dataset())
+        if dataset is None:
+            raise CommandError('База пуста, запустите с --seed')
+        client = Client()
+        client.force_login(dataset.user)
+        cookie = (f'{settings.SESSION_COOKIE_NAME}='
+                  f'{client.cookies[settings.SESSION_COOKIE_NAME].value}')
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group', kwargs={'slug': dataset.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': dataset.author.username}),
+            reverse('posts:post_detail',
+                    kwargs={'post_id': dataset.post.pk}),
+        ]
+        self.stdout.write(f'Клиентов: {options["clients"]}, '
+                          f'запросов: {options["requests"]}')
+        for name, server_class, workers in self.modes(
+                options['executor_workers']):
+            # без debug toolbar и журнала запросов DEBUG
+            with override_settings(DEBUG=False, INTERNAL_IPS=[],
+                                   DB_EXECUTOR_WORKERS=workers):
+                latencies, elapsed = self.run_mode(
+                    server_class, urls, cookie, options)
+            self.stdout.write(
+                f'{name:<25} p50 {percentile(latencies, 0.5) * 1000:>8.1f} мс'
+                f'  p99 {percentile(latencies, 0.99) * 1000:>8.1f} мс'
+                f'  {len(latencies) / elapsed:>7.1f} запросов/с')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс постов'
+
+    def handle(self, *args, **options):
+        count = get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковый индекс пересобран, постов: {count}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики постов и подписок авторов и групп, '
+            'например после bulk_create или правок в обход моделей')
+
+    def handle(self, *args, **options):
+        count = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики пересчитаны, строк: {count}'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts.timeline import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок из таблиц Follow и Post'
+
+    def handle(self, *args, **options):
+        count = rebuild_timelines()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны, подписок обработано: {count}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.trending import recompute_scores
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг «В тренде» по счетчикам постов. '
+            'Нужен после reconcile_counters и смены TRENDING_*')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        count = recompute_scores(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг пересчитан у постов: {count}'))
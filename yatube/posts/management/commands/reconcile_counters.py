@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает likes_count и comments_count постов'
+
+    def handle(self, *args, **options):
+        count = reconcile_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики исправлены у постов: {count}'))
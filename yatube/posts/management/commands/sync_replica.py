@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.routers import sync_sqlite_replica
+
+
+class Command(BaseCommand):
+    help = ('Копирует db.sqlite3 в файлы реплик DATABASE_REPLICAS. '
+            'С --interval повторяет копирование, пока не прервут: '
+            'так локально проверяется чтение с отстающей реплики')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='секунды между копиями, 0 - один раз')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('Реплики не настроены: задайте '
+                               'YATUBE_REPLICA_DB')
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                try:
+                    sync_sqlite_replica(alias)
+                except ValueError as error:
+                    raise CommandError(error)
+            self.stdout.write(self.style.SUCCESS(
+                f'Реплики обновлены: {", ".join(settings.DATABASE_REPLICAS)}'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
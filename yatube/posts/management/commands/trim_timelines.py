@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.timeline import trim_timelines
+
+
+class Command(BaseCommand):
+    help = ('Обрезает ленты подписок до TIMELINE_LENGTH последних записей. '
+            'Запускается периодически: раскладка новых постов ленты только '
+            'удлиняет')
+
+    def handle(self, *args, **options):
+        count = trim_timelines()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты обрезаны, записей удалено: {count}'))
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    # как posts.timeline.rebuild_timelines на момент миграции: в ленте
+    # читателя TIMELINE_LENGTH последних постов его авторов
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    readers = Follow.objects.order_by().values_list(
+        'user_id', flat=True).distinct()
+    for user_id in list(readers):
+        posts = Post.objects.filter(
+            author_id__in=Follow.objects.filter(
+                user_id=user_id).values('author_id')
+        ).order_by('-pub_date', '-pk').values_list('pk', 'pub_date')
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user_id, post_id=post_id,
+                           pub_date=pub_date)
+             for post_id, pub_date in posts[:settings.TIMELINE_LENGTH]),
+            batch_size=settings.TIMELINE_BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0010_likes_and_comments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации поста')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to='posts.Post', verbose_name='Пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+                'ordering': ('-pub_date',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date'], name='timeline_user_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique-timeline-entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
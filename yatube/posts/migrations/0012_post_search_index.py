@@ -0,0 +1,38 @@
+from django.db import migrations
+
+FTS_TABLE = 'posts_post_fts'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            "text, tokenize = 'unicode61 remove_diacritics 2')")
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) '
+            'SELECT id, text FROM posts_post')
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS posts_post_text_tsv_idx '
+            'ON posts_post USING GIN '
+            "(to_tsvector('russian'::regconfig, COALESCE(text, '')))")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS posts_post_text_tsv_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_timeline_added'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:31
+
+from django.db import migrations, models
+from django.db.models import (Count, IntegerField, Min, OuterRef,
+                              Subquery)
+from django.db.models.functions import Coalesce
+
+
+def delete_duplicate_likes(apps, schema_editor):
+    Like = apps.get_model('posts', 'Like')
+    Post = apps.get_model('posts', 'Post')
+    duplicates = list(Like.objects.values('user', 'post').annotate(
+        first=Min('pk'), total=Count('pk')).filter(total__gt=1))
+    for duplicate in duplicates:
+        Like.objects.filter(
+            user=duplicate['user'], post=duplicate['post']
+        ).exclude(pk=duplicate['first']).delete()
+    # дубли были посчитаны в likes_count, как в
+    # posts.counters.reconcile_counters пересчитываем его по лайкам
+    likes = Like.objects.filter(post=OuterRef('pk')).order_by().values(
+        'post').annotate(total=Count('pk')).values('total')
+    Post.objects.filter(
+        pk__in={duplicate['post'] for duplicate in duplicates}
+    ).update(likes_count=Coalesce(
+        Subquery(likes, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_likes,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique-like'),
+        ),
+    ]
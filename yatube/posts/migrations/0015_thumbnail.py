@@ -0,0 +1,33 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Thumbnail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, verbose_name='Исходная картинка')),
+                ('size', models.PositiveIntegerField(verbose_name='Заказанная ширина')),
+                ('format', models.CharField(max_length=10, verbose_name='Формат')),
+                ('image', models.ImageField(max_length=255, upload_to='thumbs/', verbose_name='Превью')),
+                ('width', models.PositiveIntegerField(verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(verbose_name='Высота')),
+            ],
+            options={
+                'verbose_name': 'Превью',
+                'verbose_name_plural': 'Превью',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='thumbnail',
+            constraint=models.UniqueConstraint(fields=('source', 'size', 'format'), name='unique-thumbnail'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:58
+
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_scores(apps, schema_editor):
+    # формула posts.trending.hot_score на момент миграции
+    Post = apps.get_model('posts', 'Post')
+    epoch = datetime(2021, 1, 1)
+    if settings.USE_TZ:
+        epoch = timezone.make_aware(epoch, timezone.utc)
+    posts = list(Post.objects.only('likes_count', 'comments_count',
+                                   'pub_date'))
+    for post in posts:
+        points = (post.likes_count
+                  + settings.TRENDING_COMMENT_WEIGHT * post.comments_count)
+        post.score = (math.log10(max(points, 1))
+                      + (post.pub_date - epoch).total_seconds()
+                      / settings.TRENDING_TIME_SCALE)
+    Post.objects.bulk_update(posts, ['score'],
+                             batch_size=settings.TRENDING_BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_post_image_dimensions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='score',
+            field=models.FloatField(default=0, verbose_name='Рейтинг'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-score', '-id'], name='post_score_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 2.2.16 on 2026-10-18 10:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_stats(apps, schema_editor):
+    # как posts.stats.rebuild_stats на момент миграции
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+
+    def counts(queryset, field):
+        return dict(queryset.order_by().values_list(field).annotate(
+            Count('pk')))
+
+    posts = counts(Post.objects.all(), 'author')
+    followers = counts(Follow.objects.all(), 'author')
+    following = counts(Follow.objects.all(), 'user')
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(author_id=pk,
+                     posts_count=posts.get(pk, 0),
+                     followers_count=followers.get(pk, 0),
+                     following_count=following.get(pk, 0))
+         for pk in posts.keys() | followers.keys() | following.keys()),
+        batch_size=500)
+    GroupStats.objects.bulk_create(
+        (GroupStats(group_id=pk, posts_count=count) for pk, count
+         in counts(Post.objects.exclude(group=None), 'group').items()),
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0018_post_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='Постов')),
+                ('followers_count', models.IntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.IntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Счетчики автора',
+                'verbose_name_plural': 'Счетчики авторов',
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group', verbose_name='Группа')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='Постов')),
+            ],
+            options={
+                'verbose_name': 'Счетчики группы',
+                'verbose_name_plural': 'Счетчики групп',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -39,8 +41,15 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        blank=True,
+        storage=ContentAddressedStorage(),
     )
+    # размеры исходной картинки из заголовка; без width_field,
+    # который открывал бы файл при каждой загрузке поста
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True)
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True)
     likes_count = models.IntegerField(
         'Лайков',
         default=0
@@ -49,11 +58,27 @@ class Post(models.Model):
         'Комментариев',
         default=0
     )
+    # рейтинг для сортировки «В тренде», см. posts.trending
+    score = models.FloatField('Рейтинг', default=0)
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='post_pub_date_idx'),
+            models.Index(fields=('group', '-pub_date', '-id'),
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=('-likes_count', '-id'),
+                         name='post_likes_count_idx'),
+            models.Index(fields=('-comments_count', '-id'),
+                         name='post_comments_count_idx'),
+            models.Index(fields=('-score', '-id'),
+                         name='post_score_idx'),
+        )
 
     def __str__(self):
         return self.text[:15]
@@ -81,6 +106,10 @@ class Comment(models.Model):
         ordering = ('-created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = (
+            models.Index(fields=('post', '-created', '-id'),
+                         name='comment_post_created_idx'),
+        )
 
     def __str__(self):
         return self.text[:15]
@@ -124,3 +153,103 @@ class Like(models.Model):
     class Meta:
         verbose_name = 'Лайк'
         verbose_name_plural = 'Лайки'
+        constraints = (models.UniqueConstraint(
+            fields=('user', 'post'), name='unique-like'), )
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации поста')
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (models.UniqueConstraint(
+            fields=('user', 'post'), name='unique-timeline-entry'), )
+        indexes = (models.Index(
+            fields=('user', '-pub_date', '-post'),
+            name='timeline_user_date_idx'), )
+
+
+class ImageBlob(models.Model):
+    """Файл ContentAddressedStorage и число постов, которые на него
+    ссылаются."""
+    name = models.CharField('Файл', max_length=255, unique=True)
+    references = models.PositiveIntegerField('Ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return self.name
+
+
+class Thumbnail(models.Model):
+    """Готовое превью картинки поста. Привязано к имени файла,
+    а не к посту, поэтому одинаковые картинки делят превью."""
+    source = models.CharField('Исходная картинка', max_length=255)
+    size = models.PositiveIntegerField('Заказанная ширина')
+    format = models.CharField('Формат', max_length=10)
+    image = models.ImageField('Превью', upload_to='thumbs/', max_length=255)
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+
+    class Meta:
+        verbose_name = 'Превью'
+        verbose_name_plural = 'Превью'
+        constraints = (models.UniqueConstraint(
+            fields=('source', 'size', 'format'), name='unique-thumbnail'), )
+
+    def __str__(self):
+        return self.image.name
+
+    @property
+    def url(self):
+        return self.image.url
+
+
+class AuthorStats(models.Model):
+    """Счетчики автора, которые меняются вместе с постами и подписками,
+    см. posts.stats."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор',
+    )
+    posts_count = models.IntegerField('Постов', default=0)
+    followers_count = models.IntegerField('Подписчиков', default=0)
+    following_count = models.IntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счетчики автора'
+        verbose_name_plural = 'Счетчики авторов'
+
+
+class GroupStats(models.Model):
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Группа',
+    )
+    posts_count = models.IntegerField('Постов', default=0)
+
+    class Meta:
+        verbose_name = 'Счетчики группы'
+        verbose_name_plural = 'Счетчики групп'
@@ -0,0 +1,155 @@
+import base64
+import binascii
+import datetime
+import json
+from collections.abc import Sequence
+
+from django.core.exceptions import (FieldDoesNotExist, FieldError,
+                                    ValidationError)
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CountedPaginator(Paginator):
+    """Paginator, которому число объектов можно передать заранее,
+    например из posts.stats: тогда COUNT(*) не выполняется."""
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder режет микросекунды, а курсору нужна точность."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CursorPage(Sequence):
+    """Страница keyset-пагинации: знает соседей, но не общее число страниц."""
+
+    number = None
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset-пагинатор по набору полей сортировки, например
+    ('-pub_date', '-pk'). Последнее поле должно быть уникальным.
+    Поля могут быть и аннотациями queryset."""
+
+    def __init__(self, object_list: QuerySet, per_page: int, ordering):
+        self.ordering = tuple(ordering)
+        self.object_list = object_list.order_by(*self.ordering)
+        self.per_page = per_page
+        self.fields = [(name.lstrip('-'), name.startswith('-'))
+                       for name in self.ordering]
+        try:
+            for name, _ in self.fields:
+                self._model_field(name)
+            self.supports_cursor = True
+        except InvalidCursor:
+            self.supports_cursor = False
+
+    def _model_field(self, name):
+        opts = self.object_list.model._meta
+        if name == 'pk':
+            return opts.pk
+        annotation = self.object_list.query.annotations.get(name)
+        if annotation is not None:
+            try:
+                return annotation.output_field
+            except FieldError:
+                raise InvalidCursor(name)
+        try:
+            return opts.get_field(name)
+        except FieldDoesNotExist:
+            raise InvalidCursor(name)
+
+    def encode_cursor(self, obj, reverse=False) -> str:
+        values = [getattr(obj, name) for name, _ in self.fields]
+        payload = json.dumps({'v': values, 'r': reverse},
+                             cls=CursorEncoder)
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, cursor: str):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            raw_values, reverse = payload['v'], bool(payload['r'])
+            if len(raw_values) != len(self.fields):
+                raise InvalidCursor(cursor)
+            values = [self._model_field(name).to_python(value)
+                      for (name, _), value in zip(self.fields, raw_values)]
+        except (ValueError, TypeError, KeyError, ValidationError,
+                binascii.Error):
+            raise InvalidCursor(cursor)
+        return values, reverse
+
+    def _keyset(self, values, reverse) -> Q:
+        condition = Q()
+        for position, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending != reverse else 'gt'
+            term = Q(**{f'{name}__{lookup}': values[position]})
+            for (prev_name, _), value in zip(self.fields[:position],
+                                             values[:position]):
+                term &= Q(**{prev_name: value})
+            condition |= term
+        return condition
+
+    def page(self, cursor=None) -> CursorPage:
+        values, reverse = self.decode_cursor(cursor) if cursor else (
+            None, False)
+        queryset = self.object_list
+        if values is not None:
+            queryset = queryset.filter(self._keyset(values, reverse))
+        if reverse:
+            queryset = queryset.reverse()
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+        next_cursor = previous_cursor = None
+        if rows and (has_more if not reverse else values is not None):
+            next_cursor = self.encode_cursor(rows[-1])
+        if rows and (has_more if reverse else values is not None):
+            previous_cursor = self.encode_cursor(rows[0], reverse=True)
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+    def get_page(self, cursor=None) -> CursorPage:
+        """Как page(), но битый курсор ведет на первую страницу."""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page(None)
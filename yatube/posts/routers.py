@@ -0,0 +1,90 @@
+import random
+import sqlite3
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY_UNTIL_KEY = 'read_primary_until'
+
+# реплика, с которой читает текущая view; gather() переносит значение
+# в потоки пула вместе с контекстом
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def current_replica():
+    """Реплика, с которой сейчас читает view, или None."""
+    return _read_alias.get()
+
+
+def stick_to_primary(request) -> None:
+    """После записи пользователь REPLICA_STICKY_SECONDS читает с основной
+    базы, чтобы видеть свои изменения, пока реплика их не догонит."""
+    if settings.DATABASE_REPLICAS:
+        request.session[PRIMARY_UNTIL_KEY] = (
+            time.time() + settings.REPLICA_STICKY_SECONDS)
+
+
+def replica_for(request):
+    """Реплика для чтений запроса или None, если читать с основной."""
+    if not settings.DATABASE_REPLICAS or request.method not in ('GET',
+                                                                'HEAD'):
+        return None
+    if request.session.get(PRIMARY_UNTIL_KEY, 0) > time.time():
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def reads_from_replica(view):
+    """Чтения ORM внутри view идут на реплику, записи - на основную."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        # сессия и пользователь загружаются до переключения: только что
+        # вошедшего пользователя на реплике может еще не быть
+        request.user.is_authenticated
+        alias = replica_for(request)
+        if alias is None:
+            return view(request, *args, **kwargs)
+        token = _read_alias.set(alias)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    """Чтения в view под reads_from_replica - с реплики, все остальное
+    и любые записи - с основной базы. Реплики - копии основной базы,
+    поэтому миграции идут только в нее."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def sync_sqlite_replica(alias: str) -> None:
+    """Копирует основную SQLite-базу в файл реплики alias через backup
+    API: копия согласована, даже если в основную в это время пишут.
+    Так локально изображается реплика с отставанием."""
+    primary = connections[DEFAULT_DB_ALIAS]
+    if primary.vendor != 'sqlite' or connections[alias].vendor != 'sqlite':
+        raise ValueError('копировать можно только SQLite в SQLite')
+    # открытое соединение Django к реплике видело бы старый снимок
+    connections[alias].close()
+    primary.ensure_connection()
+    target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+    try:
+        primary.connection.backup(target)
+    finally:
+        target.close()
@@ -0,0 +1,162 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Func, QuerySet, TextField, Value
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .models import Post
+
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+SNIPPET_TOKENS = 12
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+RUSSIAN_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ом', 'ем',
+    'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ию', 'ья', 'ье', 'ью', 'ия',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+
+
+def stem(word: str) -> str:
+    """Легкий стеммер: отрезает падежное окончание, оставляя
+    основу не короче трех букв. Дальше основа ищется по префиксу."""
+    word = word.lower()
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def query_terms(query: str) -> list:
+    return [stem(word) for word in WORD_RE.findall(query)]
+
+
+def highlight(snippet: str) -> str:
+    """Экранирует фрагмент и превращает маркеры совпадений в <mark>."""
+    return mark_safe(escape(snippet).replace(
+        SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>'))
+
+
+class BaseSearchBackend:
+    """Поисковый бэкенд: search() возвращает queryset с аннотациями
+    rank и snippet, отсортированный по ordering."""
+
+    ordering = ('-pub_date', '-pk')
+
+    def index_post(self, post: Post) -> None:
+        pass
+
+    def remove_post(self, post_id: int) -> None:
+        pass
+
+    def rebuild(self) -> int:
+        return 0
+
+    def search(self, queryset: QuerySet, query: str) -> QuerySet:
+        raise NotImplementedError
+
+    def empty(self, queryset: QuerySet) -> QuerySet:
+        """Пустая выдача, которую все равно можно сортировать по rank."""
+        return queryset.extra(select={'rank': '0', 'snippet': "''"}).none()
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Запасной вариант без индекса для любой базы."""
+
+    def search(self, queryset, query):
+        terms = WORD_RE.findall(query)
+        if not terms:
+            return self.empty(queryset)
+        for term in terms:
+            queryset = queryset.filter(text__icontains=term)
+        return queryset.extra(select={
+            'rank': '0', 'snippet': f'{Post._meta.db_table}.text'})
+
+
+class SqliteFTSBackend(BaseSearchBackend):
+    """Индекс FTS5 в виртуальной таблице posts_post_fts, rowid = Post.pk."""
+
+    table = 'posts_post_fts'
+    ordering = ('rank', '-pk')
+
+    def index_post(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [post.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, text) VALUES (%s, %s)',
+                [post.pk, post.text])
+
+    def remove_post(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [post_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, text) '
+                f'SELECT id, text FROM {Post._meta.db_table}')
+            cursor.execute(f'SELECT COUNT(*) FROM {self.table}')
+            return cursor.fetchone()[0]
+
+    def search(self, queryset, query):
+        terms = query_terms(query)
+        if not terms:
+            return self.empty(queryset)
+        match = ' '.join('"{}"*'.format(term.replace('"', ''))
+                         for term in terms)
+        return queryset.extra(
+            tables=[self.table],
+            where=[f'{self.table} MATCH %s',
+                   f'{self.table}.rowid = {Post._meta.db_table}.id'],
+            params=[match],
+            select={
+                'rank': f'bm25({self.table})',
+                'snippet': (f"snippet({self.table}, 0, '{SNIPPET_START}', "
+                            f"'{SNIPPET_END}', '…', {SNIPPET_TOKENS})"),
+            },
+        )
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector по русской конфигурации; индекс GIN создает миграция."""
+
+    config = 'russian'
+    ordering = ('-rank', '-pk')
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                                    SearchVector)
+
+        if not WORD_RE.search(query):
+            return self.empty(queryset)
+        vector = SearchVector('text', config=self.config)
+        search_query = SearchQuery(query, config=self.config)
+        options = (f'StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, '
+                   f'MaxWords={SNIPPET_TOKENS}')
+        return queryset.annotate(search=vector).filter(
+            search=search_query
+        ).annotate(
+            rank=SearchRank(vector, search_query),
+            snippet=Func(Value(self.config), F('text'), search_query,
+                         Value(options), function='ts_headline',
+                         output_field=TextField()),
+        )
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path: str) -> BaseSearchBackend:
+    return import_string(path)()
+
+
+def get_search_backend() -> BaseSearchBackend:
+    return _load_backend(settings.SEARCH_BACKEND)
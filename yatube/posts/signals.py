@@ -0,0 +1,115 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import invalidation, stats
+from .models import Comment, Follow, Group, Like, Post
+from .search import get_search_backend
+from .sqlite import configure_connection
+from .storage import release, retain
+from .timeline import backfill_author, fan_out_post, remove_author
+from .trending import hot_score
+
+
+def invalidate_post_pages(post_id, *group_ids, username=None):
+    """Сдвигает поколения ленты, групп, автора и самого поста."""
+    namespaces = [invalidation.feed(), invalidation.post(post_id)]
+    if username is None:
+        row = Post.objects.filter(pk=post_id).values_list(
+            'author__username', 'group_id').first()
+        if row is not None:
+            username, group_id = row
+            group_ids += (group_id,)
+    if username is not None:
+        namespaces.append(invalidation.author(username))
+    group_ids = {group_id for group_id in group_ids if group_id is not None}
+    if group_ids:
+        namespaces.extend(invalidation.group(slug) for slug in
+                          Group.objects.filter(pk__in=group_ids).values_list(
+                              'slug', flat=True))
+    invalidation.bump(*namespaces)
+
+
+def _image_name(post):
+    # без обращения к дескриптору: он создал бы FieldFile на каждый пост
+    image = post.__dict__.get('image')
+    return getattr(image, 'name', image) or ''
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    instance._loaded_group_id = instance.group_id
+    instance._loaded_image = _image_name(instance)
+
+
+@receiver(pre_save, sender=Post)
+def post_scored(sender, instance, **kwargs):
+    # дальше score меняют только счетчики, см. posts.counters
+    if instance._state.adding:
+        instance.score = hot_score(instance.likes_count,
+                                   instance.comments_count, instance.pub_date)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        fan_out_post(instance)
+        stats.post_added(instance)
+    else:
+        stats.post_moved(instance._loaded_group_id, instance.group_id)
+    image = _image_name(instance)
+    if image != instance._loaded_image:
+        retain(image)
+        release(instance._loaded_image)
+        instance._loaded_image = image
+    get_search_backend().index_post(instance)
+    invalidate_post_pages(instance.pk, instance.group_id,
+                          instance._loaded_group_id,
+                          username=instance.author.username)
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    get_search_backend().remove_post(instance.pk)
+    stats.post_removed(instance)
+    release(_image_name(instance))
+    invalidate_post_pages(instance.pk, instance.group_id,
+                          username=instance.author.username)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        backfill_author(instance.user_id, instance.author_id)
+        stats.follow_added(instance)
+    invalidation.bump(invalidation.author(instance.author.username))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    remove_author(instance.user_id, instance.author_id)
+    stats.follow_removed(instance)
+    invalidation.bump(invalidation.author(instance.author.username))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def post_counter_changed(sender, instance, **kwargs):
+    # счетчики видны в карточках ленты, группы и профиля, а эти
+    # страницы кэшируются целиком под своими поколениями
+    invalidate_post_pages(instance.post_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    invalidation.bump(invalidation.feed(), invalidation.group(instance.slug))
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    configure_connection(connection)
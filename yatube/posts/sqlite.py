@@ -0,0 +1,55 @@
+"""Соединения SQLite под параллельной нагрузкой.
+
+WAL пускает читателей одновременно с писателем, synchronous=NORMAL
+в WAL не портит базу при падении процесса, mmap_size и cache_size
+сокращают чтения с диска, busy_timeout ждет блокировку вместо
+мгновенного «database is locked». Прагмы SQLITE_PRAGMAS выполняются
+на каждом новом соединении, см. сигнал connection_created в signals."""
+import random
+import sqlite3
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+BUSY_MESSAGES = ('database is locked', 'database table is locked')
+
+
+def apply_pragmas(db, pragmas: dict) -> None:
+    """Выполняет прагмы на соединении sqlite3 мимо журнала запросов
+    Django: иначе они попадали бы в счет запросов страницы."""
+    for name, value in pragmas.items():
+        db.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_connection(connection) -> None:
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection.connection, settings.SQLITE_PRAGMAS)
+
+
+def is_busy(error) -> bool:
+    return any(message in str(error) for message in BUSY_MESSAGES)
+
+
+def retry_on_busy(func):
+    """Повторяет func, если SQLite ответил SQLITE_BUSY, с растущей
+    случайной паузой. Транзакция, начавшая с чтения, получает его сразу,
+    без busy_timeout, если другой писатель успел раньше.
+
+    func должна быть одной транзакцией целиком: откаченную транзакцию
+    можно повторить, а часть уже закоммиченной записи - нет. Внутри
+    чужой транзакции ошибка пробрасывается наружу."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(settings.SQLITE_BUSY_RETRIES):
+            try:
+                return func(*args, **kwargs)
+            except (OperationalError, sqlite3.OperationalError) as error:
+                if (not is_busy(error)
+                        or transaction.get_connection().in_atomic_block):
+                    raise
+            time.sleep(settings.SQLITE_BUSY_BACKOFF * 2 ** attempt
+                       * random.random())
+        return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import AuthorStats, Follow, GroupStats, Post
+
+
+def _bump(model, pk, **deltas) -> None:
+    """Сдвигает счетчики строки pk, создавая ее при первом прибавлении.
+    Вызывается в транзакции, которая создает или удаляет сам объект.
+    Уменьшение строку не создает: если ее нет, владельца удаляют
+    каскадом и строку счетчиков уже удалили вместе с ним."""
+    if pk is None:
+        return
+    rows = model.objects.filter(pk=pk)
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    if rows.update(**changes) or min(deltas.values()) < 0:
+        return
+    _, created = model.objects.get_or_create(pk=pk, defaults=deltas)
+    if not created:
+        rows.update(**changes)
+
+
+def post_added(post: Post) -> None:
+    _bump(AuthorStats, post.author_id, posts_count=1)
+    _bump(GroupStats, post.group_id, posts_count=1)
+
+
+def post_removed(post: Post) -> None:
+    _bump(AuthorStats, post.author_id, posts_count=-1)
+    _bump(GroupStats, post.group_id, posts_count=-1)
+
+
+def post_moved(old_group_id, new_group_id) -> None:
+    if old_group_id != new_group_id:
+        _bump(GroupStats, old_group_id, posts_count=-1)
+        _bump(GroupStats, new_group_id, posts_count=1)
+
+
+def follow_added(follow: Follow) -> None:
+    _bump(AuthorStats, follow.author_id, followers_count=1)
+    _bump(AuthorStats, follow.user_id, following_count=1)
+
+
+def follow_removed(follow: Follow) -> None:
+    _bump(AuthorStats, follow.author_id, followers_count=-1)
+    _bump(AuthorStats, follow.user_id, following_count=-1)
+
+
+def author_stats(user) -> AuthorStats:
+    """Счетчики автора, лучше загруженные через select_related('stats');
+    у автора без постов и подписок - нули."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        return AuthorStats(author=user)
+
+
+def group_stats(group) -> GroupStats:
+    try:
+        return group.stats
+    except GroupStats.DoesNotExist:
+        return GroupStats(group=group)
+
+
+def _counts(queryset, field: str) -> dict:
+    return dict(queryset.order_by().values_list(field).annotate(Count('pk')))
+
+
+@transaction.atomic
+def rebuild_stats() -> int:
+    """Пересчитывает счетчики всех авторов и групп с нуля,
+    возвращает число строк."""
+    posts = _counts(Post.objects.all(), 'author')
+    followers = _counts(Follow.objects.all(), 'author')
+    following = _counts(Follow.objects.all(), 'user')
+    group_posts = _counts(Post.objects.exclude(group=None), 'group')
+    AuthorStats.objects.all().delete()
+    GroupStats.objects.all().delete()
+    authors = AuthorStats.objects.bulk_create(
+        (AuthorStats(author_id=pk,
+                     posts_count=posts.get(pk, 0),
+                     followers_count=followers.get(pk, 0),
+                     following_count=following.get(pk, 0))
+         for pk in posts.keys() | followers.keys() | following.keys()),
+        batch_size=500)
+    groups = GroupStats.objects.bulk_create(
+        (GroupStats(group_id=pk, posts_count=count)
+         for pk, count in group_posts.items()),
+        batch_size=500)
+    return len(authors) + len(groups)
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.deconstruct import deconstructible
+
+HASHED_NAME_RE = re.compile(r'(?:.*/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}'
+                            r'(?:\.\w+)?$')
+
+
+def is_hashed(name: str) -> bool:
+    return bool(name) and bool(HASHED_NAME_RE.match(name))
+
+
+def hashed_name(name: str, digest: str) -> str:
+    """posts/image.gif -> posts/ab/cd/abcd…ef.gif"""
+    directory = posixpath.dirname(name)
+    _, ext = posixpath.splitext(name)
+    return posixpath.join(directory, digest[:2], digest[2:4],
+                          digest + ext.lower())
+
+
+def _blobs():
+    return apps.get_model('posts', 'ImageBlob').objects
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Каждое уникальное содержимое хранится один раз под путем из его
+    sha256. Повторная загрузка того же файла возвращает уже сохраненное
+    имя, поэтому у дубликатов общий файл и общие превью. Ссылки на файл
+    считает ImageBlob, см. retain() и release()."""
+
+    chunk_size = 64 * 2 ** 10
+
+    def get_available_name(self, name, max_length=None):
+        # имя все равно заменяется хешем в _save
+        return name
+
+    def _stage(self, content):
+        """Копирует содержимое во временный файл рядом с хранилищем,
+        считая хеш по ходу. Возвращает (путь, хеш)."""
+        directory = self.path(settings.UPLOAD_STAGING_DIR)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.upload',
+                                         delete=False) as staged:
+            for chunk in content.chunks(self.chunk_size):
+                digest.update(chunk)
+                staged.write(chunk)
+        return staged.name, digest.hexdigest()
+
+    def _hash_file(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as staged:
+            for chunk in iter(lambda: staged.read(self.chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _save(self, name, content):
+        if hasattr(content, 'temporary_file_path'):
+            # загрузку posts.uploads уже посчитали по ходу приема
+            staged, owned = content.temporary_file_path(), False
+            digest = (getattr(content, 'content_hash', None)
+                      or self._hash_file(staged))
+        else:
+            (staged, digest), owned = self._stage(content), True
+        name = hashed_name(name, digest)
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        try:
+            file_move_safe(staged, full_path)
+        except FileExistsError:
+            if owned:
+                os.remove(staged)
+        else:
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+        _blobs().get_or_create(name=name)
+        return name
+
+
+def retain(name: str) -> None:
+    if is_hashed(name):
+        _blobs().get_or_create(name=name)
+        _blobs().filter(name=name).update(references=F('references') + 1)
+
+
+def release(name: str) -> None:
+    """Снимает ссылку; файл без ссылок удаляется вместе с превью после
+    коммита: при откате пост по-прежнему ссылается на файл."""
+    if not is_hashed(name):
+        return
+    blobs = _blobs().filter(name=name)
+    # каждый шаг - одно условное обновление, так что параллельный
+    # retain() не теряется между проверкой счетчика и удалением строки
+    while True:
+        if blobs.filter(references__gt=1).update(
+                references=F('references') - 1):
+            return
+        if blobs.filter(references__lte=1).delete()[0]:
+            transaction.on_commit(lambda: _delete_unreferenced(name))
+            return
+        if not blobs.exists():
+            return
+
+
+def _delete_unreferenced(name: str) -> None:
+    # до коммита тот же файл могли загрузить снова
+    if not _blobs().filter(name=name).exists():
+        delete_file(name)
+
+
+def delete_file(name: str) -> None:
+    from .images import delete_thumbnails
+
+    delete_thumbnails(name)
+    apps.get_model('posts', 'Post')._meta.get_field(
+        'image').storage.delete(name)
+
+
+def recount_references() -> int:
+    """Пересчитывает ссылки по постам, возвращает число файлов."""
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.filter(image=OuterRef('name')).order_by().values(
+        'image').annotate(total=Count('pk')).values('total')
+    return _blobs().update(references=Coalesce(Subquery(posts), 0))
@@ -1,14 +1,23 @@
+import hashlib
+import os
 import shutil
 import tempfile
+from io import StringIO
+from unittest.mock import patch
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
-from ..models import Group, Post
+from ..images import resolve_thumbnails
+from ..models import Group, ImageBlob, Post, Thumbnail
+from ..storage import hashed_name
 
 User = get_user_model()
 
@@ -68,7 +77,8 @@ class PostCreateFormTests(TestCase):
         self.assertTrue(
             Post.objects.filter(
                 text='Тестовый текст',
-                image='posts/small.gif').exists())
+                image=hashed_name('posts/small.gif', hashlib.sha256(
+                    PostCreateFormTests.small_gif).hexdigest())).exists())
 
     def test_edit_post(self):
         """Проверка формы редактирования поста."""
@@ -94,3 +104,177 @@ class PostCreateFormTests(TestCase):
                 pk=1,
                 text='Проверка редактирования',).exists()
         )
+
+    def test_create_post_builds_thumbnails(self):
+        """Превью всех размеров и форматов строятся при сохранении формы"""
+        form_data = {
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(
+                name='thumb.gif',
+                content=PostCreateFormTests.small_gif,
+                content_type='image/gif'),
+        }
+        self.authorized_author.post(reverse('posts:post_create'),
+                                    data=form_data)
+        post = Post.objects.get(text='Пост с картинкой')
+        thumbs = Thumbnail.objects.filter(source=post.image.name)
+
+        self.assertEqual(
+            thumbs.count(),
+            len(settings.POST_IMAGE_SIZES) * len(
+                settings.POST_IMAGE_FORMATS))
+        self.assertTrue(all(thumb.width == 2 and thumb.height == 1
+                            for thumb in thumbs))
+
+        response = self.authorized_author.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+
+        self.assertContains(
+            response, thumbs.get(size=960, format='jpeg').url)
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+
+    def test_upload_limits(self):
+        """Слишком большой файл или картинка отвергаются с причиной"""
+        cases = (
+            ({'POST_IMAGE_MAX_UPLOAD_SIZE': 10}, 'Файл больше'),
+            ({'POST_IMAGE_MAX_PIXELS': 1}, 'слишком большая'),
+            ({'POST_IMAGE_UPLOAD_FORMATS': ('PNG',)}, 'в формате PNG'),
+        )
+        for limits, message in cases:
+            with self.subTest(limits=limits), override_settings(**limits):
+                form_data = {
+                    'text': 'Отвергнутый пост',
+                    'image': SimpleUploadedFile(
+                        name='limit.gif',
+                        content=PostCreateFormTests.small_gif,
+                        content_type='image/gif'),
+                }
+                response = self.authorized_author.post(
+                    reverse('posts:post_create'), data=form_data)
+
+                self.assertContains(response, message)
+                self.assertFalse(
+                    Post.objects.filter(text='Отвергнутый пост').exists())
+
+    def test_post_create_checks_csrf(self):
+        """Своя обработка загрузок не отключает проверку CSRF"""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(PostCreateFormTests.author)
+
+        response = client.post(reverse('posts:post_create'),
+                               data={'text': 'Пост без токена'})
+
+        self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertFalse(
+            Post.objects.filter(text='Пост без токена').exists())
+
+    def test_duplicate_uploads_share_file(self):
+        """Одинаковые загрузки хранятся одним файлом с общими превью"""
+        for number in range(2):
+            self.authorized_author.post(reverse('posts:post_create'), data={
+                'text': f'Дубликат {number}',
+                'image': SimpleUploadedFile(
+                    name=f'copy_{number}.gif',
+                    content=PostCreateFormTests.small_gif,
+                    content_type='image/gif'),
+            })
+        posts = Post.objects.filter(text__startswith='Дубликат')
+        names = {post.image.name for post in posts}
+        name = names.pop()
+        storage = Post._meta.get_field('image').storage
+
+        self.assertFalse(names)
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 2)
+        self.assertEqual(Thumbnail.objects.filter(source=name).count(),
+                         len(settings.POST_IMAGE_SIZES) * len(
+                             settings.POST_IMAGE_FORMATS))
+
+        posts.first().delete()
+
+        self.assertTrue(storage.exists(name))
+
+        with transaction.atomic():
+            posts.get().delete()
+            transaction.set_rollback(True)
+
+        self.assertTrue(storage.exists(name))
+
+        # TestCase не коммитит, поэтому on_commit выполняется сразу
+        with patch('posts.storage.transaction.on_commit',
+                   lambda func: func()):
+            posts.get().delete()
+
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(Thumbnail.objects.filter(source=name).exists())
+
+    def test_dedupe_images_command(self):
+        """dedupe_images сливает старые одинаковые файлы в один"""
+        storage = Post._meta.get_field('image').storage
+        os.makedirs(storage.path('posts'), exist_ok=True)
+        for number in range(2):
+            name = f'posts/legacy_{number}.gif'
+            with open(storage.path(name), 'wb') as legacy:
+                legacy.write(PostCreateFormTests.small_gif)
+            Post.objects.create(author=PostCreateFormTests.author,
+                                text=f'Старый {number}', image=name)
+
+        call_command('dedupe_images', stdout=StringIO())
+
+        names = set(Post.objects.filter(text__startswith='Старый')
+                    .values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(storage.exists(name))
+        self.assertFalse(storage.exists('posts/legacy_0.gif'))
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 2)
+
+    def test_resolve_thumbnails_batches_lookups(self):
+        """Превью страницы достаются одним запросом, потом из кэша"""
+        for number in range(2):
+            self.authorized_author.post(reverse('posts:post_create'), data={
+                'text': f'Превью {number}',
+                'image': SimpleUploadedFile(
+                    name=f'resolve_{number}.gif',
+                    # хвост после конца GIF делает файлы разными
+                    content=PostCreateFormTests.small_gif + bytes([number]),
+                    content_type='image/gif'),
+            })
+        sources = list(Post.objects.filter(
+            text__startswith='Превью').values_list('image', flat=True))
+        cache.clear()
+
+        with self.assertNumQueries(1):
+            thumbnails = resolve_thumbnails(sources + ['posts/legacy.gif'])
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                resolve_thumbnails(sources + ['posts/legacy.gif']),
+                thumbnails)
+        self.assertEqual(len(set(sources)), 2)
+        self.assertEqual(set(thumbnails), set(sources))
+        self.assertEqual(thumbnails[sources[0]]['small']['webp']['width'], 2)
+
+    @override_settings(THUMBNAIL_MISSING_CACHE_TIMEOUT=0)
+    def test_missing_thumbnails_cached_briefly(self):
+        """Отсутствие превью кэшируется на THUMBNAIL_MISSING_CACHE_TIMEOUT"""
+        cache.clear()
+        resolve_thumbnails(['posts/legacy.gif'])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_thumbnails(['posts/legacy.gif']), {})
+
+    def test_backfill_image_dimensions_command(self):
+        """backfill_image_dimensions дописывает размеры старым постам"""
+        post = Post.objects.create(
+            author=PostCreateFormTests.author,
+            text='Пост без размеров',
+            image=SimpleUploadedFile(name='old.gif',
+                                     content=PostCreateFormTests.small_gif,
+                                     content_type='image/gif'))
+
+        call_command('backfill_image_dimensions', stdout=StringIO(),
+                     stderr=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
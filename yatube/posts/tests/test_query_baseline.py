@@ -0,0 +1,29 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from .. import benchmark
+
+
+class QueryBaselineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.dataset = benchmark.seed_dataset({
+            'users': 30,
+            'groups': 3,
+            'posts': 60,
+            'follows': 60,
+            'likes': 120,
+            'comments': 120,
+        })
+
+    def test_routes_do_not_exceed_baseline_queries(self):
+        """Ни один маршрут не делает больше запросов, чем в baseline."""
+        results = benchmark.run_benchmark(self.dataset,
+                                          clear_cache=cache.clear)
+        baseline = benchmark.load_baseline(benchmark.BASELINE_PATH)
+
+        self.assertEqual(
+            benchmark.compare(results, baseline), [],
+            'обновите baseline командой benchmark_urls --update-baseline, '
+            'если рост числа запросов ожидаем')
@@ -1,15 +1,33 @@
+import hashlib
+import json
+import re
 import shutil
 import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import (OperationalError, connection, connections,
+                       transaction)
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ..models import Comment, Follow, Group, Post
+from .. import invalidation, like_buffer, routers
+from ..models import (AuthorStats, Comment, Follow, Group, Like, Post,
+                      TimelineEntry)
+from ..sqlite import retry_on_busy
+from ..storage import hashed_name
+from ..trending import hot_score
+from ..utils import SORT_MODES, load_viewer_state
+from .utils import QueryBudgetMixin
 
 User = get_user_model()
 
@@ -40,6 +58,8 @@ class PostPagesTests(TestCase):
             content=cls.small_gif,
             content_type='image/gif'
         )
+        cls.image_name = hashed_name(
+            'posts/small.gif', hashlib.sha256(cls.small_gif).hexdigest())
         cls.post = Post.objects.create(
             author=cls.author,
             text='Тестовый пост для проверки',
@@ -99,7 +119,7 @@ class PostPagesTests(TestCase):
                 'auth': first_object.author.username,
                 'Тестовый пост для проверки': first_object.text,
                 'Тестовая группа': first_object.group.title,
-                'posts/small.gif': first_object.image.name,
+                self.image_name: first_object.image.name,
             }
             for expected_context, test_context in context.items():
                 with self.subTest(expected_context=expected_context):
@@ -115,7 +135,7 @@ class PostPagesTests(TestCase):
             'Тестовый пост для проверки': object.text,
             'Тестовая группа': object.group.title,
             1: object.pk,
-            'posts/small.gif': object.image.name,
+            self.image_name: object.image.name,
         }
 
         for expected_context, test_context in context.items():
@@ -164,6 +184,8 @@ class PaginatorViewsTest(TestCase):
                 text=f'Тестовый пост {number} для проверки',
                 group=cls.group
             )
+
+    def setUp(self):
         cache.clear()
 
     def test_first_page_contains_ten_records(self):
@@ -185,6 +207,98 @@ class PaginatorViewsTest(TestCase):
                                  PaginatorViewsTest.posts_count
                                  - settings.POSTS_PER_PAGE)
 
+    @override_settings(POSTS_OFFSET_PAGES=1)
+    def test_deep_page_number_not_found(self):
+        """Номер страницы дальше POSTS_OFFSET_PAGES отдает 404."""
+        for reverse_name in PaginatorViewsTest.reverse_names:
+            with self.subTest(reverse_name=reverse_name):
+                response = self.client.get(reverse_name, {'page': 2})
+
+                self.assertEqual(response.status_code, 404)
+
+    def test_cursor_pages_follow_each_other(self):
+        """Курсорная пагинация отдает страницы без пропусков и повторов."""
+        for reverse_name in PaginatorViewsTest.reverse_names:
+            with self.subTest(reverse_name=reverse_name):
+                cache.clear()
+                first_page = self.client.get(reverse_name).context['page_obj']
+                response = self.client.get(
+                    reverse_name, {'cursor': first_page.next_cursor})
+                second_page = response.context['page_obj']
+
+                self.assertEqual(
+                    list(first_page) + list(second_page),
+                    list(Post.objects.order_by('-pub_date', '-pk')))
+                self.assertFalse(second_page.has_next())
+
+                response = self.client.get(
+                    reverse_name, {'cursor': second_page.previous_cursor})
+
+                self.assertEqual(list(response.context['page_obj']),
+                                 list(first_page))
+
+    def test_unknown_sort_mode_shares_default_cache(self):
+        """Неизвестный orderby отдает закэшированную страницу по дате
+        без запросов к базе."""
+        index = reverse('posts:index')
+        response = self.client.get(index)
+
+        for params in ({'orderby': 'text'}, {'orderby': '-pub_date'},
+                       {'page': '1', 'utm_source': 'mail'}):
+            with self.subTest(params=params):
+                with self.assertNumQueries(0):
+                    cached = self.client.get(index, params)
+
+                self.assertEqual(cached.content, response.content)
+
+    def test_cached_page_links_use_canonical_params(self):
+        """Ссылки страницы, закэшированной по каноническому ключу,
+        не несут чужих параметров запроса."""
+        response = self.client.get(reverse('posts:index'),
+                                   {'orderby': 'bogus', 'x': 'junk'})
+
+        self.assertNotContains(response, 'junk')
+        self.assertNotContains(response, 'bogus')
+        self.assertContains(response, 'orderby=-pub_date&amp;page=2')
+
+    def test_group_and_profile_cache_ignore_unknown_params(self):
+        """Группа и профиль с посторонними параметрами отдаются из одной
+        записи кэша, и в их ссылки эти параметры не попадают."""
+        for reverse_name in PaginatorViewsTest.reverse_names[1:]:
+            with self.subTest(reverse_name=reverse_name):
+                response = self.client.get(reverse_name,
+                                           {'utm_source': 'junk'})
+
+                self.assertNotContains(response, 'junk')
+                self.assertContains(response, '?page=2')
+
+                with self.assertNumQueries(0):
+                    cached = self.client.get(
+                        reverse_name, {'page': '1', 'fbclid': 'other'})
+
+                self.assertEqual(cached.content, response.content)
+
+    def test_sort_modes_use_their_ordering(self):
+        """Каждый режим сортировки главной упорядочен по своим полям."""
+        for order, mode in SORT_MODES.items():
+            with self.subTest(order=order):
+                response = self.client.get(reverse('posts:index'),
+                                           {'orderby': order})
+
+                self.assertEqual(
+                    list(response.context['page_obj']),
+                    list(Post.objects.order_by(*mode.ordering)[
+                        :settings.POSTS_PER_PAGE]))
+                self.assertEqual(response.context['order_value'], mode.label)
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор не ломает страницу, а ведет на первую."""
+        response = self.client.get(reverse('posts:index'),
+                                   {'cursor': 'broken'})
+
+        self.assertEqual(len(response.context['page_obj']),
+                         settings.POSTS_PER_PAGE)
+
 
 class PostCreateViewsTest(TestCase):
     @classmethod
@@ -246,6 +360,9 @@ class CommentCreateViewsTest(TestCase):
             post=cls.post_1,
         )
 
+    def setUp(self):
+        cache.clear()
+
     def test_unauthorized_cant_create_comment(self):
         """Неавторизованный пользователь не может создать комментарий."""
         post_detail_url = '/posts/1/comment/'
@@ -267,9 +384,8 @@ class CommentCreateViewsTest(TestCase):
         response = self.client.get(
             reverse('posts:post_detail', kwargs={'post_id': 1}))
 
-        self.assertEqual(
-            response.context['comments'].filter(text=text).exists(),
-            False)
+        self.assertNotIn(
+            text, [comment.text for comment in response.context['comments']])
 
     def test_post_page_contains_comment(self):
         """Проверка, что комментарий попал на нужные страницы"""
@@ -282,8 +398,42 @@ class CommentCreateViewsTest(TestCase):
             with self.subTest(reverse_name=reverse_name):
                 response = self.client.get(reverse_name)
 
-                self.assertEqual(response.context['comments'].filter(
-                    text=self.comment.text).exists(), value)
+                self.assertEqual(
+                    self.comment.text in [comment.text for comment
+                                          in response.context['comments']],
+                    value)
+
+    @override_settings(COMMENTS_PER_PAGE=2)
+    def test_comments_load_by_pages(self):
+        """Пост показывает первую страницу комментариев, остальные
+        отдает comments по курсору; число запросов не растет с тредом."""
+        post_url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post_2.pk})
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(post_url)
+        for number in range(5):
+            Comment.objects.create(
+                post=self.post_2, text=f'Коммент {number}',
+                author=User.objects.create_user(username=f'reader{number}'))
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(post_url)
+
+        self.assertEqual(len(few), len(many))
+        comments = response.context['comments']
+        texts = [comment.text for comment in comments]
+        cursor = comments.next_cursor
+        while cursor:
+            data = self.client.get(
+                reverse('posts:comments', kwargs={'post_id': self.post_2.pk}),
+                {'cursor': cursor}).json()
+            texts.extend(re.findall(r'Коммент \d', data['html']))
+            cursor = data['next_cursor']
+
+        self.assertEqual(texts, [f'Коммент {number}'
+                                 for number in reversed(range(5))])
+        self.assertEqual(self.client.get(reverse(
+            'posts:comments', kwargs={'post_id': 999})).status_code, 404)
 
 
 class CacheViewsTest(TestCase):
@@ -301,10 +451,12 @@ class CacheViewsTest(TestCase):
             text='Тестовый пост для проверки',
             group=cls.group_foto
         )
+
+    def setUp(self):
         cache.clear()
 
-    def test_index_page_cache(self):
-        """Проверка работы кэша главной страницы"""
+    def test_index_post_card_cache(self):
+        """Проверка кэша карточек постов на главной странице"""
         response = self.client.get(reverse('posts:index'))
         cached_page_content = response.content
 
@@ -313,7 +465,8 @@ class CacheViewsTest(TestCase):
             True
         )
 
-        CacheViewsTest.post.delete()
+        Post.objects.filter(pk=CacheViewsTest.post.pk).update(
+            text='Текст в обход сигналов')
         response = self.client.get(reverse('posts:index'))
 
         self.assertEqual(cached_page_content, response.content)
@@ -323,6 +476,93 @@ class CacheViewsTest(TestCase):
 
         self.assertNotEqual(cached_page_content, response.content)
 
+    def test_post_card_cache_invalidated_on_edit(self):
+        """Правка поста сразу обновляет его закэшированную карточку"""
+        self.client.get(reverse('posts:index'))
+        post = Post.objects.get(pk=CacheViewsTest.post.pk)
+        post.text = 'Отредактированный текст'
+        post.save()
+
+        response = self.client.get(reverse('posts:index'))
+
+        self.assertContains(response, 'Отредактированный текст')
+
+    def test_public_page_cache_invalidated_on_write(self):
+        """Кэш страницы для анонимов сбрасывается сразу после записи"""
+        response = self.client.get(reverse('posts:index'))
+        cached_page_content = response.content
+
+        self.assertEqual(
+            cached_page_content,
+            self.client.get(reverse('posts:index')).content
+        )
+
+        Post.objects.create(author=CacheViewsTest.author, text='Новый пост')
+        response = self.client.get(reverse('posts:index'))
+
+        self.assertContains(response, 'Новый пост')
+
+    def test_post_card_cache_is_viewer_independent(self):
+        """Кэш карточки не смешивает ссылки разных пользователей"""
+        self.client.get(reverse('posts:index'))
+        author_client = Client()
+        author_client.force_login(CacheViewsTest.author)
+
+        response = author_client.get(reverse('posts:index'))
+
+        self.assertContains(response, 'редактировать пост')
+
+    def test_evicted_generation_does_not_repeat(self):
+        """Вытесненное из кэша поколение не повторяет прежние"""
+        namespace = invalidation.feed()
+        invalidation.bump(namespace)
+        old = invalidation.generations([namespace])[namespace]
+
+        cache.delete(invalidation._generation_key(namespace))
+
+        self.assertGreater(
+            invalidation.generations([namespace])[namespace], old)
+
+    def test_post_detail_shows_new_author_posts_count(self):
+        """Новый пост автора меняет число его постов на странице поста"""
+        url = reverse('posts:post_detail',
+                      kwargs={'post_id': CacheViewsTest.post.pk})
+        self.assertEqual(
+            self.client.get(url).context['number_of_posts'], 1)
+
+        Post.objects.create(author=CacheViewsTest.author, text='Еще пост')
+
+        self.assertEqual(
+            self.client.get(url).context['number_of_posts'], 2)
+
+    def test_list_pages_show_new_counters(self):
+        """Лайк и комментарий видны на закэшированных списках постов"""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group', kwargs={'slug': 'foto'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+            reverse('posts:index') + '?orderby=-likes_count',
+        ]
+        for url in urls:
+            self.assertContains(self.client.get(url),
+                                'Нравится пользователям: 0')
+        reader = User.objects.create_user(username='reader')
+        authorized_client = Client()
+        authorized_client.force_login(reader)
+
+        authorized_client.get(reverse(
+            'posts:like', kwargs={'post_id': CacheViewsTest.post.pk}))
+        authorized_client.post(
+            reverse('posts:add_comment',
+                    kwargs={'post_id': CacheViewsTest.post.pk}),
+            data={'text': 'Комментарий'})
+
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, 'Нравится пользователям: 1')
+                self.assertContains(response, 'Комментариев: 1')
+
 
 class FollowCreateViewsTest(TestCase):
     @classmethod
@@ -407,3 +647,713 @@ class FollowCreateViewsTest(TestCase):
         response = self.authorized_user.get(reverse('posts:follow_index'))
 
         self.assertEqual(response.context['page_obj'].__len__(), 0)
+
+    def test_stats_follow_posts_and_follows(self):
+        """Счетчики автора меняются вместе с постами и подписками,
+        а профиль берет их вместо COUNT(*)."""
+        self.authorized_user.get(
+            reverse('posts:profile_follow', kwargs={'username': 'auth'}))
+        Post.objects.filter(author=self.author).first().delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_user.get(
+                reverse('posts:profile', kwargs={'username': 'auth'}))
+
+        stats = response.context['stats']
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count),
+            (self.posts_count - 1, 1))
+        self.assertEqual(self.user.stats.following_count, 1)
+        self.assertFalse([query for query in queries
+                          if 'COUNT(' in query['sql']])
+
+        self.authorized_user.get(
+            reverse('posts:profile_unfollow', kwargs={'username': 'auth'}))
+        self.user.stats.refresh_from_db()
+
+        self.assertEqual(self.user.stats.following_count, 0)
+
+    def test_rebuild_stats_command(self):
+        """rebuild_stats пересчитывает счетчики с нуля."""
+        AuthorStats.objects.filter(author=self.author).update(posts_count=99)
+
+        call_command('rebuild_stats', stdout=StringIO())
+
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.author).posts_count,
+            self.posts_count)
+
+    def test_delete_user_with_posts_and_follows(self):
+        """Удаление автора с постами и подписками не воссоздает его
+        счетчики, а счетчики остальных уменьшаются."""
+        leaver = User.objects.create_user(username='leaver')
+        for number in range(3):
+            Post.objects.create(author=leaver, text=f'Пост {number}')
+        Follow.objects.create(user=leaver, author=self.author)
+        Follow.objects.create(user=self.follower, author=leaver)
+
+        leaver.delete()
+        connection.check_constraints()
+
+        self.assertFalse(AuthorStats.objects.filter(
+            author_id=leaver.pk).exists())
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.author).followers_count, 0)
+        self.assertEqual(
+            AuthorStats.objects.get(author=self.follower).following_count, 0)
+
+
+class TimelineViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.old_post = Post.objects.create(
+            author=cls.author,
+            text='Пост до подписки',
+        )
+
+    def setUp(self):
+        self.authorized_follower = Client()
+        self.authorized_follower.force_login(TimelineViewsTest.follower)
+
+    def test_follow_backfills_timeline(self):
+        """Подписка добавляет в ленту уже опубликованные посты автора"""
+        self.authorized_follower.get(
+            reverse('posts:profile_follow', kwargs={'username': 'auth'})
+        )
+
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.follower, post=self.old_post).exists())
+
+    def test_new_post_fans_out_and_unfollow_trims(self):
+        """Новый пост попадает в ленту, отписка убирает посты автора"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый пост')
+
+        response = self.authorized_follower.get(reverse('posts:follow_index'))
+
+        self.assertEqual(list(response.context['page_obj']),
+                         [new_post, self.old_post])
+
+        self.authorized_follower.get(
+            reverse('posts:profile_unfollow', kwargs={'username': 'auth'})
+        )
+
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.follower).exists())
+
+    def test_timeline_cursor_pages(self):
+        """Курсор ленты подписок идет по записям ленты без пропусков"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        for number in range(settings.POSTS_PER_PAGE):
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+        url = reverse('posts:follow_index')
+
+        first_page = self.authorized_follower.get(url).context['page_obj']
+        response = self.authorized_follower.get(
+            url, {'cursor': first_page.next_cursor})
+
+        self.assertEqual(
+            list(first_page) + list(response.context['page_obj']),
+            list(Post.objects.order_by('-pub_date', '-pk')))
+
+    def test_rebuild_timelines_command(self):
+        """Команда rebuild_timelines восстанавливает ленты по подпискам"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        TimelineEntry.objects.all().delete()
+
+        call_command('rebuild_timelines', stdout=StringIO())
+
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.follower, post=self.old_post).exists())
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_trim_timelines_command(self):
+        """Команда trim_timelines оставляет TIMELINE_LENGTH новых записей"""
+        Follow.objects.create(user=self.follower, author=self.author)
+        posts = [Post.objects.create(author=self.author, text=f'Пост {number}')
+                 for number in range(3)]
+
+        call_command('trim_timelines', stdout=StringIO())
+
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(
+                user=self.follower).values_list('post', flat=True)),
+            {posts[2].pk, posts[1].pk})
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class DatasetCommandsTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_export_import_round_trip(self):
+        """import_posts восстанавливает выгрузку export_posts вместе
+        с датами, картинками и производными таблицами."""
+        author = User.objects.create_user(username='auth')
+        reader = User.objects.create_user(username='reader')
+        group = Group.objects.create(title='Группа', slug='group')
+        post = Post.objects.create(
+            author=author, group=group, text='Пост',
+            image=SimpleUploadedFile(
+                'small.gif',
+                b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00'
+                b'\x00\x3B',
+                content_type='image/gif'))
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=post.pub_date - timedelta(days=30))
+        Comment.objects.create(author=reader, post=post, text='Коммент')
+        Like.objects.create(user=reader, post=post)
+        Follow.objects.create(user=reader, author=author)
+        post.refresh_from_db()
+        image = post.image.read()
+        dump = StringIO()
+        call_command('export_posts', '-', '--include-media',
+                     '--chunk-size=1', stdout=dump, stderr=StringIO())
+
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        post.image.storage.delete(post.image.name)
+        dump.seek(0)
+        with patch('sys.stdin', dump):
+            call_command('import_posts', '-', stdout=StringIO())
+        restored = Post.objects.get()
+
+        self.assertEqual(
+            (restored.pk, restored.pub_date, restored.image.name),
+            (post.pk, post.pub_date, post.image.name))
+        self.assertEqual(restored.image.read(), image)
+        self.assertEqual(Comment.objects.get().text, 'Коммент')
+        self.assertTrue(Like.objects.filter(user=reader, post=post).exists())
+        self.assertEqual(
+            AuthorStats.objects.get(author=author).followers_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=reader, post=post).exists())
+
+    def test_import_reports_unique_conflicts(self):
+        """Строки с занятым username и зависящие от них пропускаются
+        с сообщением, остальное загружается."""
+        author = User.objects.create_user(username='auth')
+        reader = User.objects.create_user(username='reader')
+        post = Post.objects.create(author=author, text='Пост')
+        Follow.objects.create(user=reader, author=author)
+        dump = StringIO()
+        call_command('export_posts', '-', stdout=dump, stderr=StringIO())
+        User.objects.all().delete()
+        User.objects.create_user(username='auth')
+        dump.seek(0)
+        errors = StringIO()
+
+        with patch('sys.stdin', dump):
+            call_command('import_posts', '-', stdout=StringIO(),
+                         stderr=errors)
+
+        self.assertIn('username = auth', errors.getvalue())
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertTrue(User.objects.filter(pk=reader.pk).exists())
+        connection.check_constraints()
+
+
+class ExplainViewsTest(TestCase):
+    def test_list_queries_use_indexes(self):
+        """Главные запросы списков идут по индексам без сортировки"""
+        author = User.objects.create_user(username='auth')
+        group = Group.objects.create(title='Группа', slug='group')
+        post = Post.objects.create(author=author, group=group, text='Пост')
+        Comment.objects.create(author=author, post=post, text='Коммент')
+        out = StringIO()
+
+        call_command('explain_views', '--strict', stdout=out)
+
+        self.assertIn('post_pub_date_idx', out.getvalue())
+        self.assertIn('timeline_user_date_idx', out.getvalue())
+
+
+@override_settings(DB_EXECUTOR_WORKERS=2)
+class ExecutorViewsTest(TransactionTestCase):
+    """Транзакций нет, поэтому чтения страниц идут в пуле потоков"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(author=self.author, post=self.post,
+                               text='Коммент')
+        Like.objects.create(user=self.author, post=self.post)
+        self.client.force_login(self.author)
+
+    def test_pages_read_concurrently(self):
+        """Страницы с параллельными чтениями собирают тот же контекст"""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+
+        self.assertEqual(response.context['number_of_posts'], 1)
+        self.assertEqual(len(response.context['comments']), 1)
+        self.assertTrue(response.context['like'])
+
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'auth'}))
+
+        self.assertEqual(response.context['number_of_posts'], 1)
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+        self.assertEqual(response.context['liked_posts'], {self.post.pk})
+
+
+# реплика - та же база, проверяется только выбор соединения
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTest(TestCase):
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # replica - зеркало default, но со своим соединением оно не видело
+        # бы незакоммиченных данных теста: отдаем ему соединение default,
+        # а журнал запросов у псевдонима остается свой
+        connections['default'].ensure_connection()
+        connections['replica'].connection = connections['default'].connection
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].connection = None
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def get(self, url):
+        """Ответ на url и число запросов, ушедших в соединение replica."""
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = self.client.get(url)
+        return response, len(queries)
+
+    def test_reads_go_to_replica(self):
+        """Страницы читают с реплики, записи идут в основную базу"""
+        response, replica_queries = self.get(reverse('posts:index'))
+
+        self.assertGreater(replica_queries, 0)
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Post))
+        self.assertEqual(router.db_for_write(Post), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'posts'))
+
+    def test_sticky_after_write(self):
+        """После своей записи пользователь читает с основной базы"""
+        self.client.get(reverse('posts:like',
+                                kwargs={'post_id': self.post.pk}))
+
+        self.assertIn(routers.PRIMARY_UNTIL_KEY, self.client.session)
+        for url in (reverse('posts:index'),
+                    reverse('posts:post_detail',
+                            kwargs={'post_id': self.post.pk})):
+            with self.subTest(url=url):
+                self.assertEqual(self.get(url)[1], 0)
+
+        with patch('posts.routers.time.time',
+                   return_value=self.client.session[
+                       routers.PRIMARY_UNTIL_KEY] + 1):
+            self.assertGreater(self.get(reverse('posts:index'))[1], 0)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        """Без реплик все читается с основной базы и сессия не меняется"""
+        self.client.get(reverse('posts:like',
+                                kwargs={'post_id': self.post.pk}))
+
+        self.assertNotIn(routers.PRIMARY_UNTIL_KEY, self.client.session)
+        self.assertEqual(self.get(reverse('posts:index'))[1], 0)
+
+
+@override_settings(SQLITE_BUSY_BACKOFF=0)
+class SqliteTuningTest(TestCase):
+    def test_pragmas_applied(self):
+        """Новое соединение получает прагмы SQLITE_PRAGMAS"""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0],
+                             settings.SQLITE_PRAGMAS['busy_timeout'])
+
+    def locked_once(self):
+        calls = []
+
+        def write():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return len(calls)
+
+        return retry_on_busy(write)
+
+    def test_busy_write_retried(self):
+        """Транзакция, получившая SQLITE_BUSY, повторяется"""
+        # TestCase держит открытую транзакцию, ее и подменяем
+        with patch.object(connection, 'in_atomic_block', False):
+            self.assertEqual(self.locked_once()(), 2)
+
+    def test_no_retry_inside_transaction(self):
+        """Внутри чужой транзакции ошибка уходит наружу"""
+        with transaction.atomic(), self.assertRaises(OperationalError):
+            self.locked_once()()
+
+
+class SearchViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.post_cats = Post.objects.create(
+            author=cls.author,
+            text='Мои коты любят <b>рыбу</b>',
+        )
+        cls.post_dogs = Post.objects.create(
+            author=cls.author,
+            text='Собаки гуляют во дворе',
+        )
+
+    def test_search_finds_word_forms(self):
+        """Поиск находит пост по другой форме слова."""
+        response = self.client.get(reverse('posts:search_result'),
+                                   {'q': 'котами'})
+
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.post_cats])
+
+    def test_empty_search_returns_empty_page(self):
+        """Пустой запрос отдает пустую страницу, а не ошибку."""
+        response = self.client.get(reverse('posts:search_result'))
+
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_search_highlights_escaped_snippet(self):
+        """Сниппет экранирует текст и подсвечивает совпадение."""
+        response = self.client.get(reverse('posts:search_result'),
+                                   {'q': 'рыба'})
+        snippet = response.context['page_obj'][0].snippet
+
+        self.assertIn('&lt;b&gt;<mark>рыбу</mark>&lt;/b&gt;', snippet)
+
+    def test_search_index_follows_edit_and_delete(self):
+        """Индекс обновляется при правке и удалении поста."""
+        self.post_dogs.text = 'Кошки гуляют во дворе'
+        self.post_dogs.save()
+        response = self.client.get(reverse('posts:search_result'),
+                                   {'q': 'собаки'})
+
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+        self.post_dogs.delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        response = self.client.get(reverse('posts:search_result'),
+                                   {'q': 'кошки'})
+
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_search_without_words_returns_empty_page(self):
+        """Запрос из одних знаков препинания отдает пустую страницу."""
+        for query in ('', '!!!', ' ,.- '):
+            with self.subTest(query=query):
+                response = self.client.get(reverse('posts:search_result'),
+                                           {'q': query})
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['page_obj']), 0)
+
+
+class ViewerStateTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.viewer = User.objects.create_user(username='viewer')
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Пост {number}')
+            for number in range(3)
+        ]
+        Like.objects.create(user=cls.viewer, post=cls.posts[0])
+        Like.objects.create(user=cls.viewer, post=cls.posts[2])
+        Follow.objects.create(user=cls.viewer, author=cls.author)
+
+    def test_viewer_state_single_query(self):
+        """Лайки и подписки страницы загружаются одним запросом."""
+        with self.assertNumQueries(1):
+            viewer = load_viewer_state(self.viewer, self.posts[:2])
+
+        self.assertEqual(viewer.liked_posts, {self.posts[0].pk})
+        self.assertEqual(viewer.followed_authors, {self.author.pk})
+
+    def test_list_page_passes_liked_set(self):
+        """Страница-список получает лайки зрителя множеством."""
+        client = Client()
+        client.force_login(self.viewer)
+        cache.clear()
+
+        response = client.get(reverse('posts:index'))
+
+        self.assertEqual(response.context['liked_posts'],
+                         {self.posts[0].pk, self.posts[2].pk})
+
+
+class CounterViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.user = User.objects.create_user(username='user')
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Тестовый пост для проверки',
+        )
+
+    def setUp(self):
+        self.authorized_user = Client()
+        self.authorized_user.force_login(CounterViewsTest.user)
+
+    def test_like_and_unlike_update_counter(self):
+        """Повторный лайк не меняет счетчик, снятие лайка уменьшает его."""
+        like_url = reverse('posts:like', kwargs={'post_id': self.post.pk})
+        unlike_url = reverse('posts:unlike', kwargs={'post_id': self.post.pk})
+
+        self.authorized_user.get(like_url)
+        self.authorized_user.get(like_url)
+        self.post.refresh_from_db()
+
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 1)
+
+        self.authorized_user.get(unlike_url)
+        self.authorized_user.get(unlike_url)
+        self.post.refresh_from_db()
+
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_comment_updates_counter(self):
+        """Комментарий увеличивает comments_count поста."""
+        self.authorized_user.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            data={'text': 'Комментарий'},
+        )
+        self.post.refresh_from_db()
+
+        self.assertEqual(self.post.comments_count, 1)
+
+    def test_import_activity_command(self):
+        """import_activity пишет комментарии и лайки пачками, пропуская
+        повторы и битые строки; счетчики растут на число новых строк."""
+        Like.objects.create(user=self.user, post=self.post)
+        lines = [
+            {'type': 'like', 'post': self.post.pk, 'user': 'user'},
+            {'type': 'like', 'post': self.post.pk, 'user': 'auth'},
+            {'type': 'like', 'post': 999, 'user': 'user'},
+            {'type': 'comment', 'post': self.post.pk, 'author': 'user',
+             'text': 'Первый'},
+            {'type': 'comment', 'post': self.post.pk, 'author': 'nobody',
+             'text': 'Без автора'},
+        ]
+        reader = User.objects.create_user(username='reader')
+        lines += [{'type': 'like', 'post': self.post.pk, 'user': 'reader'},
+                  {'type': 'comment', 'post': self.post.pk,
+                   'author': 'reader', 'text': 'Второй'}]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as source:
+            source.write('\n'.join(json.dumps(line) for line in lines))
+            source.write('\nне json\n')
+            source.flush()
+            call_command('import_activity', source.name, '--batch-size=3',
+                         stdout=StringIO(), stderr=StringIO())
+        self.post.refresh_from_db()
+
+        self.assertEqual(
+            set(Like.objects.values_list('user', flat=True)),
+            {self.user.pk, reader.pk})
+        self.assertEqual(
+            sorted(self.post.comments.values_list('text', flat=True)),
+            ['Второй', 'Первый'])
+        self.assertEqual(
+            (self.post.likes_count, self.post.comments_count), (1, 2))
+
+    def test_reconcile_counters_command(self):
+        """Команда reconcile_counters исправляет расхождения счетчиков."""
+        Like.objects.create(user=self.user, post=self.post)
+        Post.objects.filter(pk=self.post.pk).update(
+            likes_count=10, comments_count=5)
+
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+
+        self.assertEqual(
+            (self.post.likes_count, self.post.comments_count), (1, 0))
+
+    def test_trending_score_follows_counters(self):
+        """Лайки и комментарии меняют score в том же UPDATE, что и счетчики,
+        а recompute_trending дает то же значение."""
+        older = Post.objects.create(author=self.author, text='Старый пост')
+        Post.objects.filter(pk=older.pk).update(
+            pub_date=self.post.pub_date - timedelta(days=1))
+        call_command('recompute_trending', stdout=StringIO())
+        self.authorized_user.get(
+            reverse('posts:like', kwargs={'post_id': self.post.pk}))
+        self.authorized_user.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            data={'text': 'Комментарий'},
+        )
+        self.post.refresh_from_db()
+        incremental = self.post.score
+
+        call_command('recompute_trending', stdout=StringIO())
+        self.post.refresh_from_db()
+
+        self.assertAlmostEqual(incremental, self.post.score, places=6)
+        self.assertAlmostEqual(
+            self.post.score, hot_score(1, 1, self.post.pub_date), places=6)
+        response = self.authorized_user.get(
+            reverse('posts:index'), {'orderby': '-score'})
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']][:2],
+            [self.post.pk, older.pk])
+
+
+@override_settings(LIKES_BUFFER_ENABLED=True)
+class LikeBufferViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.users = [User.objects.create_user(username=f'user{number}')
+                     for number in range(2)]
+        cls.post = Post.objects.create(
+            author=cls.author,
+            text='Тестовый пост для проверки',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_buffered_likes_are_visible_before_flush(self):
+        """Лайк из буфера виден сразу, а в базу попадает при сбросе."""
+        for user in self.users:
+            client = Client()
+            client.force_login(user)
+            client.get(reverse('posts:like',
+                               kwargs={'post_id': self.post.pk}))
+        self.post.refresh_from_db()
+
+        self.assertEqual(self.post.likes_count, 1)
+
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+
+        self.assertEqual(response.context['post'].likes_count, 2)
+
+        call_command('flush_likes', stdout=StringIO())
+        self.post.refresh_from_db()
+
+        self.assertEqual(self.post.likes_count, 2)
+
+    def test_flush_stops_at_unwritten_journal_entry(self):
+        """Сброс не проскакивает номер журнала, запись которого еще
+        не сделана, и дочитывает ее в следующий раз."""
+        other = Post.objects.create(author=self.author, text='Другой пост')
+        # сбрасываем вручную; номер уже взят, а запись журнала
+        # add() еще не сделал
+        cache.set(like_buffer.FLUSH_THROTTLE_KEY, True)
+        cache.set(like_buffer.JOURNAL_SEQ_KEY, 1, timeout=None)
+        cache.set(like_buffer.DIRTY_KEY.format(self.post.pk), True,
+                  timeout=None)
+        cache.set(like_buffer.DELTA_KEY.format(self.post.pk), 1,
+                  timeout=None)
+        like_buffer.add(other.pk, 1)
+
+        self.assertEqual(like_buffer.flush(), 0)
+
+        cache.set(like_buffer.JOURNAL_KEY.format(1), self.post.pk,
+                  timeout=None)
+
+        self.assertEqual(like_buffer.flush(), 2)
+        self.assertEqual(
+            dict(Post.objects.filter(pk__in=[self.post.pk, other.pk])
+                 .values_list('pk', 'likes_count')),
+            {self.post.pk: 1, other.pk: 1})
+
+    def test_flush_waits_for_running_flush(self):
+        """Пока идет сброс, flush_likes не применяет те же дельты еще раз"""
+        cache.set(like_buffer.FLUSH_THROTTLE_KEY, True)
+        like_buffer.add(self.post.pk, 1)
+        cache.set(like_buffer.FLUSH_LOCK_KEY, True)
+        out = StringIO()
+
+        call_command('flush_likes', stdout=out)
+
+        self.assertIn('постов обновлено: 0', out.getvalue())
+        cache.delete(like_buffer.FLUSH_LOCK_KEY)
+
+        self.assertEqual(like_buffer.flush(), 1)
+        self.assertEqual(like_buffer.flush(), 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(like_buffer.pending([self.post.pk]), {})
+
+
+class QueryBudgetViewsTest(QueryBudgetMixin, TestCase):
+    budget = 12
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='foto',
+            description='Тестовое описание',
+        )
+        cls.authors = [User.objects.create_user(username=f'auth{number}')
+                       for number in range(3)]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.add_posts(cls.authors[:1], 1)
+
+    @classmethod
+    def add_posts(cls, authors, count):
+        for author in authors:
+            for number in range(count):
+                post = Post.objects.create(
+                    author=author,
+                    group=cls.group,
+                    text=f'Тестовый пост {number}',
+                )
+                Like.objects.create(user=cls.reader, post=post)
+                Comment.objects.create(
+                    author=cls.reader, post=post, text='Комментарий')
+
+    def test_list_pages_fit_query_budget(self):
+        """Число запросов страниц-списков не зависит от числа постов."""
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group', kwargs={'slug': 'foto'}),
+            reverse('posts:profile', kwargs={'username': 'auth0'}),
+            reverse('posts:search_result') + '?q=пост',
+        )
+        clients = {'anonymous': Client(), 'reader': reader_client}
+        for name, client in clients.items():
+            for url in urls:
+                with self.subTest(client=name, url=url):
+                    self.assertQueryBudget(
+                        client, url, self.budget,
+                        lambda: self.add_posts(self.authors, 3))
+        with self.subTest(client='reader', url='follow'):
+            self.assertQueryBudget(
+                reader_client, reverse('posts:follow_index'), self.budget,
+                lambda: self.add_posts(self.authors, 3))
@@ -0,0 +1,26 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """Проверки числа SQL-запросов, которое делает страница."""
+
+    def count_queries(self, client, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            client.get(url)
+        return len(queries)
+
+    def assertQueryBudget(self, client, url, budget, grow):
+        """Страница укладывается в budget запросов и не делает больше
+        после grow(), который добавляет на нее посты."""
+        before = self.count_queries(client, url)
+        grow()
+        after = self.count_queries(client, url)
+        self.assertLessEqual(
+            after, budget,
+            f'{url}: {after} запросов при бюджете {budget}')
+        self.assertEqual(
+            before, after,
+            f'{url}: число запросов зависит от числа постов')
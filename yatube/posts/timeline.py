@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.db.models import Count, F, FilteredRelation, Q, QuerySet
+
+from .models import Follow, Post, TimelineEntry
+
+TIMELINE_ORDERING = ('-timeline_pub_date', '-timeline_post')
+
+
+def fan_out_post(post: Post) -> None:
+    """Раскладывает новый пост по лентам всех подписчиков автора.
+    Длину лент здесь не проверяем: это обход TIMELINE_LENGTH записей
+    на каждого подписчика, их обрезает команда trim_timelines."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_author(user_id: int, author_id: int) -> None:
+    """Добавляет в ленту читателя последние посты нового автора."""
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('pk', 'pub_date')
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts[:settings.TIMELINE_LENGTH]),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_timeline(user_id)
+
+
+def trim_timeline(user_id: int) -> int:
+    """Оставляет в ленте читателя TIMELINE_LENGTH последних записей,
+    возвращает число удаленных."""
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    length = settings.TIMELINE_LENGTH
+    cutoff = list(entries.order_by('-pub_date', '-post_id').values_list(
+        'pub_date', 'post_id')[length:length + 1])
+    if not cutoff:
+        return 0
+    pub_date, post_id = cutoff[0]
+    deleted, _ = entries.filter(
+        Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, post_id__lte=post_id)
+    ).delete()
+    return deleted
+
+
+def trim_timelines() -> int:
+    """Обрезает все ленты длиннее TIMELINE_LENGTH, возвращает число
+    удаленных записей."""
+    overfull = TimelineEntry.objects.order_by().values('user_id').annotate(
+        entries=Count('pk')).filter(
+        entries__gt=settings.TIMELINE_LENGTH).values_list('user_id',
+                                                          flat=True)
+    return sum(trim_timeline(user_id) for user_id in list(overfull))
+
+
+def remove_author(user_id: int, author_id: int) -> None:
+    """Убирает из ленты читателя посты автора, от которого он отписался."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def rebuild_timelines() -> int:
+    """Пересобирает все ленты по подпискам, возвращает число подписок."""
+    TimelineEntry.objects.all().delete()
+    follows = Follow.objects.values_list('user_id', 'author_id')
+    count = 0
+    for user_id, author_id in follows.iterator():
+        backfill_author(user_id, author_id)
+        count += 1
+    return count
+
+
+def timeline_posts(user) -> QuerySet:
+    """Посты ленты читателя, отсортированные по полям его записей ленты:
+    так и выборка, и keyset-фильтр идут по timeline_user_date_idx
+    через одно соединение, без сортировки во временном дереве."""
+    return Post.objects.annotate(
+        entry=FilteredRelation('timeline', condition=Q(timeline__user=user)),
+    ).filter(entry__isnull=False).annotate(
+        timeline_pub_date=F('entry__pub_date'),
+        timeline_post=F('entry__post_id'),
+    ).order_by(*TIMELINE_ORDERING)
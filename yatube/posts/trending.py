@@ -0,0 +1,65 @@
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Greatest, Log
+from django.utils import timezone
+
+from .models import Post
+
+# начало отсчета для слагаемого времени: так score остается небольшим
+EPOCH = datetime(2021, 1, 1)
+
+
+def _points(likes, comments):
+    return likes + settings.TRENDING_COMMENT_WEIGHT * comments
+
+
+def hot_score(likes: int, comments: int, pub_date=None) -> float:
+    """log10 очков плюс время публикации в TRENDING_TIME_SCALE:
+    пост, вышедший на TRENDING_TIME_SCALE секунд позже, стоит вдесятеро
+    больше очков. Старые посты не нужно пересчитывать - новые просто
+    обгоняют их, поэтому score меняется только вместе со счетчиками."""
+    pub_date = pub_date or timezone.now()
+    epoch = (timezone.make_aware(EPOCH, timezone.utc)
+             if timezone.is_aware(pub_date) else EPOCH)
+    return (math.log10(max(_points(likes, comments), 1))
+            + (pub_date - epoch).total_seconds()
+            / settings.TRENDING_TIME_SCALE)
+
+
+def _log10(points):
+    return Log(Value(10.0), Greatest(points, Value(1)))
+
+
+def score_change(likes=0, comments=0):
+    """Новое значение score для UPDATE, который сдвигает счетчики на
+    likes и comments (числа или выражения). В SET справа видны старые
+    значения столбцов, поэтому логарифм старых очков меняется на логарифм
+    новых, а слагаемое времени остается как было."""
+    old = _points(F('likes_count'), F('comments_count'))
+    new = old + _points(likes, comments)
+    return F('score') + _log10(new) - _log10(old)
+
+
+def recompute_scores(batch_size: int = None) -> int:
+    """Пересчитывает score всех постов по текущим счетчикам: одна выборка
+    и один UPDATE с CASE на пачку. Нужен после reconcile_counters и смены
+    настроек формулы. Возвращает число постов."""
+    batch_size = batch_size or settings.TRENDING_BATCH_SIZE
+    rows = Post.objects.order_by('pk').values_list(
+        'pk', 'likes_count', 'comments_count', 'pub_date')
+    last_pk = total = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return total
+        Post.objects.filter(pk__in=[row[0] for row in batch]).update(
+            score=Case(
+                *(When(pk=pk, then=Value(hot_score(likes, comments, date)))
+                  for pk, likes, comments, date in batch),
+                output_field=FloatField(),
+            ))
+        last_pk = batch[-1][0]
+        total += len(batch)
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import tempfile
+from functools import wraps
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import (TemporaryUploadedFile,
+                                            UploadedFile)
+from django.core.files.uploadhandler import (FileUploadHandler,
+                                             StopFutureHandlers)
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+# столько байт начала файла копится, пока Pillow не разберет заголовок;
+# у JPEG перед размерами может идти длинный EXIF
+HEADER_MAX_SIZE = 2 ** 20
+
+
+def staging_dir():
+    """Каталог для загрузок внутри MEDIA_ROOT: оттуда FileSystemStorage
+    переносит файл на место переименованием, а не копированием."""
+    try:
+        path = default_storage.path(settings.UPLOAD_STAGING_DIR)
+    except NotImplementedError:
+        return settings.FILE_UPLOAD_TEMP_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    """Загруженный файл во временном файле из staging_dir().
+    upload_error - почему файл отвергнут, image_size - (ширина, высота)
+    из заголовка, content_hash - sha256 содержимого."""
+
+    def __init__(self, name, content_type, charset, content_type_extra):
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + ext,
+                                           dir=staging_dir())
+        UploadedFile.__init__(self, file, name, content_type, 0, charset,
+                              content_type_extra)
+        self.upload_error = None
+        self.image_size = None
+        self.content_hash = None
+
+
+class LimitedImageUploadHandler(FileUploadHandler):
+    """Пишет загрузку на диск кусками по chunk_size, так что в памяти
+    никогда не бывает всего файла. Размер файла, формат и число пикселей
+    проверяются по ходу загрузки и по одному заголовку, без декодирования.
+    Отвергнутый файл дальше не пишется, а причина остается в
+    upload_error - ее показывает форма."""
+
+    chunk_size = 64 * 2 ** 10
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = StagedUploadedFile(self.file_name, self.content_type,
+                                       self.charset, self.content_type_extra)
+        self.header = b''
+        self.received = 0
+        self.digest = hashlib.sha256()
+        raise StopFutureHandlers()
+
+    def reject(self, message):
+        self.file.upload_error = message
+        self.file.truncate(0)
+
+    def read_header(self, complete=False):
+        try:
+            with Image.open(BytesIO(self.header)) as image:
+                size, image_format = image.size, image.format
+        except Image.DecompressionBombError:
+            self.reject('Слишком большая картинка по числу пикселей')
+            return
+        except (OSError, SyntaxError, ValueError):
+            if complete or len(self.header) >= HEADER_MAX_SIZE:
+                self.reject('Загрузите картинку в формате '
+                            + ', '.join(settings.POST_IMAGE_UPLOAD_FORMATS))
+            return
+        self.header = b''
+        self.file.image_size = size
+        width, height = size
+        if image_format not in settings.POST_IMAGE_UPLOAD_FORMATS:
+            self.reject('Загрузите картинку в формате '
+                        + ', '.join(settings.POST_IMAGE_UPLOAD_FORMATS))
+        elif width * height > settings.POST_IMAGE_MAX_PIXELS:
+            self.reject(f'Картинка {width}×{height} слишком большая, '
+                        f'максимум {settings.POST_IMAGE_MAX_PIXELS} пикселей')
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.file.upload_error:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+            self.reject('Файл больше ' + filesizeformat(
+                settings.POST_IMAGE_MAX_UPLOAD_SIZE))
+            return None
+        if self.file.image_size is None:
+            self.header += raw_data
+            self.read_header()
+        if not self.file.upload_error:
+            self.digest.update(raw_data)
+            self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.file.image_size is None and not self.file.upload_error:
+            self.read_header(complete=True)
+        self.file.seek(0)
+        self.file.size = 0 if self.file.upload_error else file_size
+        if not self.file.upload_error:
+            self.file.content_hash = self.digest.hexdigest()
+        return self.file
+
+
+def limited_image_uploads(view):
+    """Загрузки view идут через LimitedImageUploadHandler, остальные
+    формы сайта, например админка, его ограничений не получают.
+    Обработчики меняют до чтения тела запроса, а CsrfViewMiddleware
+    читает request.POST раньше view, поэтому middleware view пропускает,
+    а CSRF проверяется уже после подмены."""
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [LimitedImageUploadHandler(request)]
+        return protected(request, *args, **kwargs)
+    return wrapper
@@ -13,6 +13,8 @@ urlpatterns = [
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/comment/',
          views.add_comment, name='add_comment'),
+    path('posts/<int:post_id>/comments/',
+         views.post_comments, name='comments'),
     path('follow/', views.follow_index, name='follow_index'),
     path(
         'profile/<str:username>/follow/',
@@ -25,5 +27,6 @@ urlpatterns = [
         name='profile_unfollow'
     ),
     path('posts/<int:post_id>/like/', views.post_like, name='like'),
+    path('posts/<int:post_id>/unlike/', views.post_unlike, name='unlike'),
     path('search/', views.search_result, name='search_result'),
 ]
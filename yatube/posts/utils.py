@@ -1,19 +1,187 @@
+from typing import NamedTuple
+
 from django.conf import settings
-from django.core.paginator import Paginator
-from django.db.models import QuerySet
+from django.db.models import CharField, QuerySet, Value
+from django.http import Http404, QueryDict
+
+from . import like_buffer
+from .executor import gather
+from .fragments import annotate_card_versions
+from .images import resolve_thumbnails
+from .models import Comment, Follow, Like, Post
+from .paginators import CountedPaginator, CursorPaginator
+
+POSTS_ORDERING = ('-pub_date', '-pk')
+# matches comment_post_created_idx
+COMMENTS_ORDERING = ('-created', '-pk')
+
+
+class SortMode(NamedTuple):
+    label: str
+    ordering: tuple
+
+
+# ?orderby= values the index accepts; each ordering has its own index
+SORT_MODES = {
+    '-score': SortMode('В тренде', ('-score', '-pk')),
+    '-pub_date': SortMode('Дата', POSTS_ORDERING),
+    '-comments_count': SortMode('Комментарии', ('-comments_count', '-pk')),
+    '-likes_count': SortMode('Лайки', ('-likes_count', '-pk')),
+}
+DEFAULT_SORT = '-pub_date'
+
+
+def sort_mode(request) -> str:
+    """The ?orderby= value if it is a known sort mode, DEFAULT_SORT
+    otherwise, so arbitrary strings never reach order_by()"""
+    order = request.GET.get('orderby')
+    return order if order in SORT_MODES else DEFAULT_SORT
+
+
+def page_params(request) -> QueryDict:
+    """Canonical query of a list page: its paging parameters only. Its
+    links are built from these as well, so a page cached for one
+    spelling carries no junk to the others"""
+    params = QueryDict(mutable=True)
+    for name in ('page', 'cursor'):
+        value = request.GET.get(name)
+        if value and value != '1':
+            params[name] = value
+    return params
+
+
+def page_variant(request) -> str:
+    """Canonical cache variant of a list page, so tracking and unknown
+    parameters do not each get a cache entry of their own"""
+    return f'{request.path}?{page_params(request).urlencode()}'
+
+
+def sorted_page_params(request) -> QueryDict:
+    """Canonical query of a sorted list page: the sort mode and the
+    paging parameters"""
+    params = QueryDict(mutable=True)
+    params['orderby'] = sort_mode(request)
+    params.update(page_params(request))
+    return params
+
+
+def sorted_page_variant(request) -> str:
+    """Canonical cache variant of a sorted list page, so every spelling
+    of a first page shares one cache entry per mode"""
+    return f'{request.path}?{sorted_page_params(request).urlencode()}'
+
+
+def post_cards(posts: QuerySet = None) -> QuerySet:
+    """Posts with everything a post card renders joined in, so a list
+    page costs the same number of queries whatever its size"""
+    if posts is None:
+        posts = Post.objects.all()
+    return posts.select_related('author', 'group')
+
+
+def _page_number(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 1
+
+
+def pagination(request: str, post: QuerySet,
+               ordering=POSTS_ORDERING, count: int = None) -> dict:
+    """return 'context' dictionary with Paginator 'page_obj'
+
+    ?cursor= switches to keyset paging, ?page= keeps offset paging
+    for the first POSTS_OFFSET_PAGES pages (for every page when the
+    ordering is not a model field, e.g. search rank); deeper page
+    numbers are a 404, as their OFFSET scans every skipped row.
+    A known count (see posts.stats) saves the COUNT query of offset pages
+    """
+    cursor_paginator = CursorPaginator(
+        post, settings.POSTS_PER_PAGE, ordering)
+    cursor = request.GET.get('cursor')
+    if cursor and cursor_paginator.supports_cursor:
+        return cursor_paginator.get_page(cursor)
+    number = request.GET.get('page')
+    if (cursor_paginator.supports_cursor
+            and _page_number(number) > settings.POSTS_OFFSET_PAGES):
+        raise Http404('Дальние страницы доступны только по курсору')
+    paginator = CountedPaginator(cursor_paginator.object_list,
+                                 settings.POSTS_PER_PAGE, count=count)
+    page_obj = paginator.get_page(number)
+    page_obj.offset_range = paginator.page_range
+    page_obj.next_cursor = None
+    if not cursor_paginator.supports_cursor:
+        return page_obj
+    page_obj.offset_range = range(
+        1, min(paginator.num_pages, settings.POSTS_OFFSET_PAGES) + 1)
+    if page_obj.has_next():
+        page_obj.next_cursor = cursor_paginator.encode_cursor(page_obj[-1])
+    return page_obj
+
+
+def comments_page(post_id: int, cursor: str = None):
+    """One keyset page of a post's comments, newest first, with the
+    authors joined in: a page costs one query however long the thread"""
+    paginator = CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        settings.COMMENTS_PER_PAGE, COMMENTS_ORDERING)
+    return paginator.get_page(cursor)
+
+
+class ViewerState(NamedTuple):
+    liked_posts: frozenset = frozenset()
+    followed_authors: frozenset = frozenset()
+
+
+def load_viewer_state(user, posts) -> ViewerState:
+    """Likes and follows of the viewer for the posts of one page,
+    fetched with a single UNION query"""
+    posts = list(posts)
+    if not user.is_authenticated or not posts:
+        return ViewerState()
+    likes = Like.objects.filter(
+        user=user, post_id__in={post.pk for post in posts}
+    ).annotate(
+        kind=Value('like', output_field=CharField())
+    ).values_list('kind', 'post_id')
+    follows = Follow.objects.filter(
+        user=user, author_id__in={post.author_id for post in posts}
+    ).annotate(
+        kind=Value('follow', output_field=CharField())
+    ).values_list('kind', 'author_id')
+    liked_posts, followed_authors = set(), set()
+    for kind, pk in likes.union(follows, all=True):
+        (liked_posts if kind == 'like' else followed_authors).add(pk)
+    return ViewerState(frozenset(liked_posts), frozenset(followed_authors))
+
 
-from .models import Like
+def fetched_page(page_obj):
+    """Loads the rows of a lazy Django Page right away"""
+    page_obj.object_list = list(page_obj.object_list)
+    return page_obj
 
 
-def pagination(request: str, post: QuerySet) -> dict:
-    """return 'context' dictionary with Paginator 'page_obj' """
-    paginator = Paginator(post, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+def page_context(request, page_obj) -> dict:
+    """Context shared by post list pages: the page itself, pending
+    like deltas, fragment cache versions, thumbnails and the viewer's
+    state. The cache lookups and the two queries run concurrently;
+    thumbnails maps image names to their resolved thumbnails"""
+    posts = list(fetched_page(page_obj))
+    # resolves the lazy request.user here rather than in a pool thread
+    user = request.user if request.user.is_authenticated else None
 
+    def annotate_from_cache():
+        like_buffer.apply_pending(posts)
+        annotate_card_versions(posts)
 
-def user_liked_posts(user) -> list:
-    if user.is_authenticated:
-        return [like.post.pk for like in Like.objects.filter(user=user)]
-    else:
-        return []
+    viewer, _, thumbnails = gather(
+        lambda: load_viewer_state(user, posts) if user else ViewerState(),
+        annotate_from_cache,
+        lambda: resolve_thumbnails(post.image.name for post in posts),
+    )
+    return {
+        'page_obj': page_obj,
+        'thumbnails': thumbnails,
+        'liked_posts': viewer.liked_posts,
+        'followed_authors': viewer.followed_authors,
+    }
@@ -1,111 +1,166 @@
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseRedirect
+from django.db import transaction
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
-from posts.models import Follow, Group, Post, User, Like
+from django.template.loader import render_to_string
+from posts.models import Follow, Group, Post, User
 
+from . import counters, invalidation, like_buffer
 from .forms import CommentForm, PostForm
-from .utils import pagination, user_liked_posts
-
-
-@cache_page(20, key_prefix='index_page')
+from .images import process_image, resolve_thumbnails
+from .fragments import annotate_card_versions
+from .executor import gather
+from .invalidation import cache_public_page
+from .routers import reads_from_replica, stick_to_primary
+from .search import get_search_backend, highlight
+from .sqlite import retry_on_busy
+from .stats import author_stats, group_stats
+from .timeline import TIMELINE_ORDERING, timeline_posts
+from .uploads import limited_image_uploads
+from .utils import (SORT_MODES, comments_page, page_context, page_params,
+                    page_variant, pagination, post_cards, sort_mode,
+                    sorted_page_params, sorted_page_variant)
+
+
+@reads_from_replica
+@cache_public_page(lambda: [invalidation.feed()],
+                   variant=sorted_page_variant)
 def index(request):
-    order = request.GET.get('orderby', '-pub_date')
-    posts = Post.objects.select_related('group', 'author').order_by(order)
-    page_obj = pagination(request, posts)
-    liked_posts = user_liked_posts(request.user)
-    order_value = {
-        '-pub_date': 'Дата',
-        '-likes_count': 'Лайки',
-        '-comments_count': 'Комментарии',
-    }
+    mode = SORT_MODES[sort_mode(request)]
+    page_obj = pagination(request, post_cards(), ordering=mode.ordering)
     context = {
-        'page_obj': page_obj,
-        'liked_posts': liked_posts,
-        'order_value': order_value[order],
+        **page_context(request, page_obj),
+        'order_value': mode.label,
+        'sort_modes': SORT_MODES,
+        'query_params': sorted_page_params(request),
     }
     return render(request, 'posts/index.html', context)
 
 
+@reads_from_replica
 def search_result(request):
-    text_search = request.GET.get('q', '/')
-    posts = Post.objects.filter(text__icontains=text_search)
-    page_obj = pagination(request, posts)
-    liked_posts = user_liked_posts(request.user)
+    text_search = request.GET.get('q', '')
+    backend = get_search_backend()
+    posts = backend.search(post_cards(), text_search)
+    page_obj = pagination(request, posts, ordering=backend.ordering)
+    for post in page_obj:
+        post.snippet = highlight(post.snippet)
     context = {
-        'page_obj': page_obj,
-        'liked_posts': liked_posts,
+        **page_context(request, page_obj),
+        'text_search': text_search,
     }
     return render(request, 'posts/search_result.html', context)
 
 
+@reads_from_replica
+@cache_public_page(lambda slug: [invalidation.group(slug)],
+                   variant=page_variant)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('group', 'author')
-    page_obj = pagination(request, posts)
-    liked_posts = user_liked_posts(request.user)
+    group = get_object_or_404(Group.objects.select_related('stats'),
+                              slug=slug)
+    page_obj = pagination(request, post_cards(group.posts.all()),
+                          count=group_stats(group).posts_count)
     context = {
+        **page_context(request, page_obj),
         'group': group,
-        'page_obj': page_obj,
-        'liked_posts': liked_posts, }
+        'query_params': page_params(request), }
     return render(request, 'posts/group_list.html', context)
 
 
+@reads_from_replica
+@cache_public_page(lambda username: [invalidation.author(username)],
+                   variant=page_variant)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    posts = user.posts.select_related('group', 'author')
-    number_of_posts = posts.count()
-    page_obj = pagination(request, posts)
-    liked_posts = user_liked_posts(request.user)
-    if (request.user.is_authenticated
-       and request.user.follower.filter(author=user).exists()):
+    user = get_object_or_404(User.objects.select_related('stats'),
+                             username=username)
+    stats = author_stats(user)
+    page_obj = pagination(request, post_cards(user.posts.all()),
+                          count=stats.posts_count)
+    context = page_context(request, page_obj)
+    if page_obj:
+        following = user.pk in context['followed_authors']
+    elif (request.user.is_authenticated
+          and request.user.follower.filter(author=user).exists()):
         following = True
     else:
         following = False
-    context = {
-        'page_obj': page_obj,
+    context.update({
         'username': user,
-        'number_of_posts': number_of_posts,
+        'number_of_posts': stats.posts_count,
+        'stats': stats,
         'following': following,
-        'liked_posts': liked_posts, }
+        'query_params': page_params(request), })
     return render(request, 'posts/profile.html', context)
 
 
+def post_detail_namespaces(post_id):
+    """Пост и его автор: на странице поста есть число постов автора."""
+    namespaces = [invalidation.post(post_id)]
+    username = Post.objects.filter(pk=post_id).values_list(
+        'author__username', flat=True).first()
+    if username is not None:
+        namespaces.append(invalidation.author(username))
+    return namespaces
+
+
+@reads_from_replica
+@cache_public_page(post_detail_namespaces)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    number_of_posts = post.author.posts.count()
-    number_of_likes = post.likes.count()
-    comments = post.comments.select_related('post')
+    post = get_object_or_404(
+        post_cards().select_related('author__stats'), pk=post_id)
+    like_buffer.apply_pending([post])
+    annotate_card_versions([post])
+    number_of_likes = post.likes_count
     form = CommentForm(request.POST)
-    if (request.user.is_authenticated
-       and post.likes.filter(user=request.user).exists()):
-        like = True
-    else:
-        like = False
+    viewer = request.user if request.user.is_authenticated else None
+    comments, like = gather(
+        lambda: comments_page(post.pk, request.GET.get('cursor')),
+        lambda: (viewer is not None
+                 and post.likes.filter(user=viewer).exists()),
+    )
     context = {
         'post': post,
-        'number_of_posts': number_of_posts,
+        'number_of_posts': author_stats(post.author).posts_count,
         'form': form,
         'comments': comments,
         'number_of_likes': number_of_likes,
-        'like': like, }
+        'like': like,
+        'thumbnails': resolve_thumbnails([post.image.name]), }
     return render(request, 'posts/post_detail.html', context)
 
 
+@reads_from_replica
+@cache_public_page(lambda post_id: [invalidation.post(post_id)])
+def post_comments(request, post_id):
+    """Следующая страница комментариев для кнопки «Еще комментарии»:
+    HTML-фрагмент и курсор страницы после него."""
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    comments = comments_page(post_id, request.GET.get('cursor'))
+    return JsonResponse({
+        'html': render_to_string('includes/comment_list.html',
+                                 {'comments': comments}, request),
+        'next_cursor': comments.next_cursor,
+    })
+
+
 @login_required
+@limited_image_uploads
 def post_create(request):
-    if request.method == 'POST':
-        form = PostForm(request.POST, files=request.FILES or None)
-        if form.is_valid():
-            post = form.save(commit=False)
-            post.author = request.user
-            post.save()
-            return redirect('posts:profile', username=request.user.username)
-    form = PostForm()
+    form = PostForm(request.POST or None, files=request.FILES or None)
+    if form.is_valid():
+        post = form.save(commit=False)
+        post.author = request.user
+        # счетчики posts.stats меняются в той же транзакции
+        retry_on_busy(transaction.atomic(post.save))()
+        stick_to_primary(request)
+        process_image(post.image.name)
+        return redirect('posts:profile', username=request.user.username)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
 @login_required
+@limited_image_uploads
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     current_user = request.user
@@ -120,10 +175,13 @@ def post_edit(request, post_id):
                         files=request.FILES or None,
                         instance=post)
         if form.is_valid():
-            form.save()
+            post = retry_on_busy(transaction.atomic(form.save))()
+            stick_to_primary(request)
+            if 'image' in form.changed_data:
+                process_image(post.image.name)
             return redirect('posts:post_detail', post_id)
-        else:
-            return render(request, 'posts/create_post.html', context)
+        context = {'is_edit': True, 'form': form}
+        return render(request, 'posts/create_post.html', context)
 
 
 @login_required
@@ -134,35 +192,38 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
-        post.comments_count = post.comments.count()
-        post.save()
-        print(post.comments_count)
+        counters.add_comment(comment)
+        stick_to_primary(request)
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@reads_from_replica
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = pagination(request, posts)
-    context = {'page_obj': page_obj, }
+    posts = post_cards(timeline_posts(request.user))
+    page_obj = pagination(request, posts, ordering=TIMELINE_ORDERING)
+    context = page_context(request, page_obj)
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@retry_on_busy
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
         Follow.objects.get_or_create(user=request.user, author=author)
+        stick_to_primary(request)
     return redirect('posts:follow_index')
 
 
 @login_required
+@retry_on_busy
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     follow = Follow.objects.filter(user=request.user, author=author)
     if follow.exists():
         follow.delete()
+        stick_to_primary(request)
     return redirect('posts:follow_index')
 
 
@@ -170,8 +231,16 @@ def profile_unfollow(request, username):
 def post_like(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if post.author != request.user:
-        Like.objects.get_or_create(user=request.user, post=post)
-        post.likes_count = post.likes.count()
-        post.save()
+        counters.like_post(request.user, post)
+        stick_to_primary(request)
+    next = request.GET.get('next', '/')
+    return HttpResponseRedirect(next)
+
+
+@login_required
+def post_unlike(request, post_id):
+    post = get_object_or_404(Post, pk=post_id)
+    counters.unlike_post(request.user, post)
+    stick_to_primary(request)
     next = request.GET.get('next', '/')
     return HttpResponseRedirect(next)
@@ -1,7 +1,11 @@
 import os
+import sys
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# запуск тестов: manage.py test или py.test
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
 
 SECRET_KEY = '7tz#dpci+=+@42&ozeiji@as@y(@=(k37hq6k#r%kd6tlhjl2v'
 
@@ -71,9 +75,46 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # соединение живет между запросами потока, а не открывается
+        # заново на каждый
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# прагмы каждого нового соединения с SQLite, см. posts.sqlite
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 256 * 2 ** 20,
+    # отрицательное значение - в КиБ, а не в страницах
+    'cache_size': -64 * 2 ** 10,
+    'busy_timeout': 5000,
+}
+
+# повторы транзакции, получившей SQLITE_BUSY, и первая пауза в секундах
+SQLITE_BUSY_RETRIES = 5
+
+SQLITE_BUSY_BACKOFF = 0.01
+
+# реплики только для чтения, см. posts.routers; локально реплика -
+# копия db.sqlite3, которую обновляет manage.py sync_replica --interval 5.
+# Псевдоним replica есть всегда (в тестах это зеркало default), но читать
+# с него начинают, только когда он в DATABASE_REPLICAS
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.environ.get('YATUBE_REPLICA_DB',
+                           DATABASES['default']['NAME']),
+    'CONN_MAX_AGE': 60,
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_REPLICAS = ['replica'] if os.environ.get('YATUBE_REPLICA_DB') else []
+
+DATABASE_ROUTERS = ['posts.routers.ReplicaRouter']
+
+# сколько секунд после своей записи пользователь читает с основной базы;
+# не меньше допустимого отставания реплики
+REPLICA_STICKY_SECONDS = 10
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -106,6 +147,9 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 POSTS_PER_PAGE = 10
 
+# комментарии поста грузятся страницами, см. posts.utils.comments_page
+COMMENTS_PER_PAGE = 20
+
 STATIC_URL = '/static/'
 
 LOGIN_URL = 'users:login'
@@ -129,4 +173,67 @@ CACHES = {
 
 INTERNAL_IPS = [
     '127.0.0.1',
-]
\ No newline at end of file
+]
+TIMELINE_LENGTH = 1000
+
+TIMELINE_BATCH_SIZE = 500
+
+POSTS_OFFSET_PAGES = 5
+
+# posts.search.PostgresSearchBackend для PostgreSQL,
+# posts.search.SimpleSearchBackend для баз без полнотекстового поиска
+SEARCH_BACKEND = 'posts.search.SqliteFTSBackend'
+
+# write-behind буфер счетчика лайков, см. posts.like_buffer
+LIKES_BUFFER_ENABLED = False
+
+LIKES_BUFFER_CACHE = 'default'
+
+LIKES_BUFFER_FLUSH_INTERVAL = 10
+
+# сколько держится блокировка сброса, если сбросивший процесс упал
+LIKES_BUFFER_LOCK_TIMEOUT = 60
+
+# сортировка «В тренде», см. posts.trending: комментарий весит как
+# TRENDING_COMMENT_WEIGHT лайков, пост на TRENDING_TIME_SCALE секунд
+# новее равен посту с вдесятеро большим числом очков
+TRENDING_COMMENT_WEIGHT = 2
+
+TRENDING_TIME_SCALE = 45000
+
+TRENDING_BATCH_SIZE = 300
+
+# размер пачки bulk_add_comments и bulk_like, см. posts.counters
+BULK_WRITE_BATCH_SIZE = 500
+
+# потоки для одновременных чтений страницы, см. posts.executor;
+# 0 - все запросы страницы по очереди в потоке запроса
+DB_EXECUTOR_WORKERS = 0
+
+# превью картинок постов, см. posts.images: имя в шаблоне -> ширина
+POST_IMAGE_SIZES = {'big': 960, 'small': 480}
+
+POST_IMAGE_FORMATS = ('jpeg', 'webp')
+
+# каталог внутри MEDIA_ROOT, откуда загрузка переносится на место
+UPLOAD_STAGING_DIR = 'uploads'
+
+POST_IMAGE_MAX_UPLOAD_SIZE = 10 * 2 ** 20
+
+POST_IMAGE_MAX_PIXELS = 40 * 10 ** 6
+
+POST_IMAGE_UPLOAD_FORMATS = ('JPEG', 'MPO', 'PNG', 'GIF', 'WEBP')
+
+# процессы для построения превью; 0 - строить в потоке запроса
+# (так в тестах: фоновая запись не успевает за сменой MEDIA_ROOT)
+POST_IMAGE_WORKERS = 0 if TESTING else 2
+
+# готовые превью меняются только при пересборке, она и сбрасывает кэш
+THUMBNAIL_CACHE_TIMEOUT = 60 * 60 * 24
+
+# картинки, у которых превью еще строятся
+THUMBNAIL_MISSING_CACHE_TIMEOUT = 60
+
+# страницы для анонимов живут долго: их сбрасывают сигналы,
+# см. posts.invalidation
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6